@@ -0,0 +1,61 @@
+# Benchmarks for the multiple choice checks, using pytest-benchmark.
+#
+#   pytest benchmarks --benchmark-autosave
+#
+# stores the timings under .benchmarks/, named after the current commit, and
+#
+#   pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+#
+# compares a new run to the last stored one.
+import os
+import random
+import sys
+
+import pytest
+
+# boot_django.py is in the repository root, which plain `pytest` does not put on sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boot_django import boot_django
+
+boot_django()
+
+SIZES = [5,50,500,5000]
+
+def make_mc_data(question_count,option_count=4,seed=0):
+    rng = random.Random(seed)
+    mc_data = []
+    for q_number in range(1,question_count + 1):
+        options = tuple((f'Antwoord {o_number}',rng.random() < 0.4,f'Tip bij antwoord {o_number}' if rng.random() < 0.5 else None)
+                        for o_number in range(1,option_count + 1))
+        if not any(correct for (_,correct,_) in options):
+            # a student has to pick at least one letter
+            options = ((options[0][0],True,options[0][2]),) + options[1:]
+        mc_data.append((f'Vraag {q_number}',) + options)
+    return mc_data
+
+def make_submission(mc_data,seed=0,mistake_rate=0.05):
+    """Returns the bytes of a well-formed submission which answers every question,
+    mostly correctly, with some whitespace and comments mixed in."""
+    rng = random.Random(seed)
+    lines = ['// ingediend door een student']
+    for (q_number,(question,*options)) in enumerate(mc_data,start=1):
+        letters = [chr(ord('a') + o_idx) for (o_idx,option) in enumerate(options) if option[1] != (rng.random() < mistake_rate)]
+        lines.append(f'{q_number} {" ".join(letters) or "a"}' + (' // twijfel' if rng.random() < 0.1 else ''))
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+@pytest.fixture(params=SIZES,ids=lambda size: f'{size}q')
+def size(request):
+    return request.param
+
+@pytest.fixture
+def mc_data(size):
+    return make_mc_data(size)
+
+@pytest.fixture
+def submission_bytes(mc_data):
+    return make_submission(mc_data)
+
+@pytest.fixture
+def correct_submission_bytes(mc_data):
+    return make_submission(mc_data,mistake_rate=0)
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+from antlr4 import CommonTokenStream
+
+from xchk_multiple_choice_strategies.ByteCharStream import ByteCharStream
+from xchk_multiple_choice_strategies.MultipleChoiceLexer import MultipleChoiceLexer
+from xchk_multiple_choice_strategies.MultipleChoiceParser import MultipleChoiceParser
+from xchk_multiple_choice_strategies.answerkey import AnswerKey
+from xchk_multiple_choice_strategies.model import question_bank
+from xchk_multiple_choice_strategies.parsing import ParseCache, get_parse_cache, parse_with_antlr, set_parse_cache
+from xchk_multiple_choice_strategies.resultcache import ResultCache, get_result_cache, set_result_cache
+from xchk_multiple_choice_strategies.scanner import iter_scan, scan
+from xchk_multiple_choice_strategies.strats import MultipleChoiceAnswerCheck, MultipleChoiceFormatCheck
+
+def _token_stream(data):
+    stream = CommonTokenStream(MultipleChoiceLexer(ByteCharStream(data)))
+    stream.fill()
+    return stream
+
+def test_scanner(benchmark,submission_bytes):
+    assert benchmark(scan,submission_bytes) is not None
+
+def test_lexer(benchmark,submission_bytes):
+    benchmark(_token_stream,submission_bytes)
+
+def test_parser(benchmark,submission_bytes):
+    def setup():
+        stream = _token_stream(submission_bytes)
+        return ((MultipleChoiceParser(stream),),{})
+    benchmark.pedantic(lambda parser: parser.multiplechoice(),setup=setup,rounds=10)
+
+def test_parse_with_antlr(benchmark,submission_bytes):
+    # what submissions the scanner rejects go through, timed here on well-formed input
+    assert benchmark(parse_with_antlr,submission_bytes).syntax_errors == 0
+
+def test_streaming_grade(benchmark,mc_data,submission_bytes):
+    # what the answer check does for content no other check parsed; the submissions have mistakes, so this exits early
+    answer_key = AnswerKey(mc_data)
+    benchmark(lambda: answer_key.passes(iter_scan(submission_bytes)))
+
+def test_full_grade(benchmark,mc_data,correct_submission_bytes):
+    # a submission without mistakes is read to the end
+    answer_key = AnswerKey(mc_data)
+    submission_bytes = correct_submission_bytes
+    assert answer_key.passes(iter_scan(submission_bytes))
+    benchmark(lambda: answer_key.passes(iter_scan(submission_bytes)))
+
+def test_render(benchmark,mc_data):
+    benchmark(MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=mc_data).render)
+
+def test_render_uncached(benchmark,mc_data):
+    benchmark(MultipleChoiceAnswerCheck._render,question_bank(mc_data),None)
+
+@pytest.fixture
+def student_path(tmp_path,submission_bytes):
+    (tmp_path / 'antwoorden.txt').write_bytes(submission_bytes)
+    return str(tmp_path)
+
+@pytest.fixture
+def no_caches():
+    # otherwise every round after the first is a result or parse cache hit
+    (previous_results,previous_parses) = (get_result_cache(),get_parse_cache())
+    set_result_cache(ResultCache(maxsize=0))
+    set_parse_cache(ParseCache(maxsize=0))
+    yield
+    set_result_cache(previous_results)
+    set_parse_cache(previous_parses)
+
+@pytest.mark.usefixtures('no_caches')
+def test_format_check_submission(benchmark,student_path):
+    chk = MultipleChoiceFormatCheck(filename='antwoorden.txt')
+    outcome = benchmark(chk.check_submission,SimpleNamespace(content_uid=None),student_path,True,1,False)
+    assert outcome.outcome
+
+@pytest.mark.usefixtures('no_caches')
+def test_answer_check_submission(benchmark,mc_data,student_path):
+    chk = MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=mc_data)
+    benchmark(chk.check_submission,SimpleNamespace(content_uid=None),student_path,True,1,False)
@@ -0,0 +1,22 @@
+from antlr4 import InputStream
+
+class ByteCharStream(InputStream):
+    """CharStream over ASCII bytes, without the list of code points built by `InputStream`.
+
+    Accepts anything that supports the buffer protocol (`bytes`, `mmap`, ...) and does not copy it."""
+
+    def __init__(self,data):
+        self.name = "<bytes>"
+        self.data = memoryview(data).cast('B')
+        self._index = 0
+        self._size = len(self.data)
+
+    def getText(self,start,stop):
+        if stop >= self._size:
+            stop = self._size-1
+        if start >= self._size:
+            return ""
+        return str(self.data[start:stop+1],'ascii')
+
+    def __str__(self):
+        return str(self.data,'ascii')
@@ -0,0 +1,22 @@
+from .MultipleChoiceListener import MultipleChoiceListener
+from .scanner import question_number
+
+class MultipleChoiceCollector(MultipleChoiceListener):
+    """Parse listener which records `(question_number, letters)` for every qa as soon as it is matched,
+    and the `(line, column)` of its number in `positions`.
+
+    Meant for a parser with `buildParseTrees = False`: each `QaContext` still
+    holds its own tokens when it is exited, but is not kept in a tree."""
+
+    def __init__(self):
+        super().__init__()
+        self.qas = []
+        self.positions = []
+
+    def exitQa(self,ctx):
+        number = ctx.INT()
+        # no number if error recovery gave up on this qa
+        if number is None or not number.getText().isdigit():
+            return
+        self.qas.append((question_number(number.getText()),''.join(l.getText() for l in ctx.LETTER())))
+        self.positions.append((number.symbol.line,number.symbol.column))
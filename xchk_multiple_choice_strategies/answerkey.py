@@ -0,0 +1,155 @@
+import hashlib
+import itertools
+from collections import namedtuple
+
+from .model import question_bank
+
+MAX_OPTIONS = 26
+
+# kinds of ErrorRecord
+NUMBERING = 'numbering'
+INVALID_QUESTION = 'invalid_question'
+UNKNOWN_OPTION = 'unknown_option'
+MISSING = 'missing'
+INCORRECT = 'incorrect'
+
+# `option` is counted from 0, `line` from 1 and `column` from 0, as by ANTLR
+# `expected` is the question expected instead of `question`, for NUMBERING
+ErrorRecord = namedtuple('ErrorRecord',['kind','question','option','line','column','expected'],defaults=[None,None,None,None])
+
+def _bits(mask):
+    idx = 0
+    while mask:
+        if mask & 1:
+            yield idx
+        mask >>= 1
+        idx += 1
+
+class AnswerKey:
+    """Compiled, immutable form of a `QuestionBank`, or of anything `question_bank` accepts.
+
+    For question `q` (counted from 0), `correct[q]` is a bitmask of the correct
+    options (bit 0 is option a), `hinted[q]` a bitmask of the options which have a
+    hint and `hints[q][o]` the hint for option `o`, if any. Keys which grade
+    the same way have the same `fingerprint`."""
+
+    __slots__ = ('option_counts','correct','hinted','hints','fingerprint')
+
+    def __init__(self,mc_data):
+        option_counts = []
+        correct = []
+        hinted = []
+        hints = []
+        for (q_idx,question) in enumerate(question_bank(mc_data),start=1):
+            options = question.options
+            if len(options) > MAX_OPTIONS:
+                raise ValueError(f'question {q_idx} has {len(options)} options, at most {MAX_OPTIONS} can be answered with a letter')
+            correct_mask = 0
+            hinted_mask = 0
+            for (o_idx,option) in enumerate(options):
+                if option.correct:
+                    correct_mask |= 1 << o_idx
+                if option.hint:
+                    hinted_mask |= 1 << o_idx
+            option_counts.append(len(options))
+            correct.append(correct_mask)
+            hinted.append(hinted_mask)
+            hints.append(tuple(option.hint for option in options))
+        object.__setattr__(self,'option_counts',tuple(option_counts))
+        object.__setattr__(self,'correct',tuple(correct))
+        object.__setattr__(self,'hinted',tuple(hinted))
+        object.__setattr__(self,'hints',tuple(hints))
+        compiled = repr((self.option_counts,self.correct,self.hinted,self.hints))
+        object.__setattr__(self,'fingerprint',hashlib.sha256(compiled.encode('utf-8')).hexdigest())
+
+    def __setattr__(self,name,value):
+        raise AttributeError('AnswerKey is immutable')
+
+    def __len__(self):
+        return len(self.option_counts)
+
+    def qa_error_records(self,expected_idx,q_number,letters,position=(None,None)):
+        """Returns an `ErrorRecord` for each error in the answer `letters` to question `q_number`,
+        which was expected to be question `expected_idx` and starts at `(line, column)` `position`."""
+        (line,column) = position
+        records = []
+        if q_number != expected_idx:
+            records.append(ErrorRecord(NUMBERING,q_number,line=line,column=column,expected=expected_idx))
+        if not 0 < q_number <= len(self):
+            records.append(ErrorRecord(INVALID_QUESTION,q_number,line=line,column=column))
+            return records
+        q_idx = q_number - 1
+        option_count = self.option_counts[q_idx]
+        given = 0
+        for letter in letters:
+            o_idx = ord(letter.lower()) - ord('a')
+            if o_idx < option_count:
+                given |= 1 << o_idx
+            else:
+                records.append(ErrorRecord(UNKNOWN_OPTION,q_number,o_idx,line,column))
+        correct = self.correct[q_idx]
+        hinted = self.hinted[q_idx]
+        # missing answers, then incorrect answers
+        # only those with a hint count, as in the original checker
+        for o_idx in _bits(correct & ~given & hinted):
+            records.append(ErrorRecord(MISSING,q_number,o_idx,line,column))
+        for o_idx in _bits(given & ~correct & hinted):
+            records.append(ErrorRecord(INCORRECT,q_number,o_idx,line,column))
+        return records
+
+    def message(self,record):
+        """Returns the message for an `ErrorRecord` found with this key."""
+        if record.kind == NUMBERING:
+            return f'Vraag {record.expected} werd verwacht op de plaats waar {record.question} voorkomt.'
+        if record.kind == INVALID_QUESTION:
+            return f'Vraag {record.question} is geen geldige index. Er zijn {len(self)} vragen en deze worden geteld vanaf 1.'
+        if record.kind == UNKNOWN_OPTION:
+            return f"Vraag {record.question}: er is geen antwoord {chr(ord('a') + record.option)}."
+        return f'Vraag {record.question}: {self.hints[record.question - 1][record.option]}'
+
+    def qa_errors(self,expected_idx,q_number,letters):
+        """Returns the errors for the answer `letters` to question `q_number`, which was expected to be question `expected_idx`."""
+        return [self.message(record) for record in self.qa_error_records(expected_idx,q_number,letters)]
+
+    def qa_passes(self,expected_idx,q_number,letters):
+        """Says whether `qa_errors` would find no errors, without formatting any messages."""
+        if q_number != expected_idx or not 0 < q_number <= len(self):
+            return False
+        q_idx = q_number - 1
+        option_count = self.option_counts[q_idx]
+        given = 0
+        for letter in letters:
+            o_idx = ord(letter.lower()) - ord('a')
+            if o_idx >= option_count:
+                return False
+            given |= 1 << o_idx
+        return not (given ^ self.correct[q_idx]) & self.hinted[q_idx]
+
+    def passes(self,qas):
+        """Says whether a sequence of `(question_number, letters)` pairs is free of errors.
+
+        Stops consuming `qas` at the first answer with an error."""
+        expected_idx = 1
+        for (q_number,letters) in qas:
+            if not self.qa_passes(expected_idx,q_number,letters):
+                return False
+            expected_idx = q_number + 1
+        return True
+
+    def iter_error_records(self,qas,positions=None):
+        """Yields the `ErrorRecord`s for a sequence of `(question_number, letters)` pairs, one answer
+        at a time. `positions` holds the `(line, column)` at which each answer starts, if known."""
+        expected_idx = 1
+        if positions is None:
+            positions = itertools.repeat((None,None))
+        for ((q_number,letters),position) in zip(qas,positions):
+            yield from self.qa_error_records(expected_idx,q_number,letters,position)
+            expected_idx = q_number + 1
+
+    def iter_errors(self,qas):
+        """Yields the errors for a sequence of `(question_number, letters)` pairs, one answer at a time."""
+        return map(self.message,self.iter_error_records(qas))
+
+    def grade(self,qas):
+        """Returns the errors for a sequence of `(question_number, letters)` pairs."""
+        return list(self.iter_errors(qas))
@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MultipleChoiceStrategiesConfig(AppConfig):
     name = 'xchk_multiple_choice_strategies'
+
+    def ready(self):
+        # off by default: most submissions never reach the ANTLR parser
+        # and loading it would slow down every process that starts Django
+        if getattr(settings,'XCHK_MC_WARM_UP_PARSER',False):
+            from .parsing import warm_up
+            warm_up()
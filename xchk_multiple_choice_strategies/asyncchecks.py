@@ -0,0 +1,85 @@
+import copy
+import os
+
+from .instrumentation import start_timer
+from .parsing import load_submission
+
+# asyncio and concurrent.futures are imported when first needed, most processes never grade asynchronously
+
+DEFAULT_ASYNC_EXECUTOR = 'thread'
+
+_executor = None
+
+def get_executor():
+    """Returns the executor which parses and grades for `check_async`, configured through
+    the `XCHK_MC_ASYNC_EXECUTOR` ('thread' or 'process') and `XCHK_MC_ASYNC_WORKERS` settings on first use.
+
+    With 'process', the result cache, metrics sink and item collector of the worker processes are used."""
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        from django.conf import settings
+        kind = DEFAULT_ASYNC_EXECUTOR
+        workers = None
+        if settings.configured:
+            kind = getattr(settings,'XCHK_MC_ASYNC_EXECUTOR',DEFAULT_ASYNC_EXECUTOR)
+            workers = getattr(settings,'XCHK_MC_ASYNC_WORKERS',None)
+        if kind == 'thread':
+            _executor = ThreadPoolExecutor(max_workers=workers,thread_name_prefix='xchk-mc')
+        elif kind == 'process':
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            raise ValueError(f"XCHK_MC_ASYNC_EXECUTOR should be 'thread' or 'process', not {kind!r}")
+    return _executor
+
+def set_executor(executor):
+    """Makes `check_async` use `executor`, e.g. one shared with other work. `None` restores the configured one."""
+    global _executor
+    _executor = executor
+
+def _for_worker(check):
+    """Returns the check to send to a worker process in place of `check`.
+
+    Seeds are computed before the check is sent, so the copy goes without the
+    `shuffle_seed` function, which need not be picklable."""
+    if getattr(check,'shuffle_seed',None) is None:
+        return check
+    check = copy.copy(check)
+    check.shuffle_seed = None
+    return check
+
+def _check_loaded(check,content,desired_outcome,init_check_number,ancestor_has_alternatives,options):
+    timer = start_timer()
+    return check.check_content(content,desired_outcome,init_check_number,ancestor_has_alternatives,timer,**options)
+
+# running checks, so that concurrent requests for the same check on the same file share one
+_in_flight = {}
+
+async def _check(loop,check,path,desired_outcome,init_check_number,ancestor_has_alternatives,options):
+    # the loop's default executor only waits for the disk
+    from concurrent.futures import ProcessPoolExecutor
+    content = await loop.run_in_executor(None,load_submission,path)
+    executor = get_executor()
+    if isinstance(executor,ProcessPoolExecutor):
+        check = _for_worker(check)
+    return await loop.run_in_executor(executor,_check_loaded,check,content,desired_outcome,init_check_number,ancestor_has_alternatives,options)
+
+async def check_async(check,path,desired_outcome,init_check_number,ancestor_has_alternatives,**options):
+    """Runs `check.check_content` for the submission at `path` without blocking the event loop.
+    `options` are passed on to `check_content`.
+
+    The file is read in the loop's default executor and checked in the one returned
+    by `get_executor`. Callers which ask for the same check of the same file while
+    it is running wait for that run. Each caller gets its own copy of the outcome.
+    Checks run outside any `parsing.grading_run`, they share parse results through `parsing.get_parse_cache`."""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    key = (loop,id(check),os.path.abspath(path),desired_outcome,init_check_number,ancestor_has_alternatives,tuple(sorted(options.items())))
+    task = _in_flight.get(key)
+    if task is None:
+        task = loop.create_task(_check(loop,check,path,desired_outcome,init_check_number,ancestor_has_alternatives,options))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _task: _in_flight.pop(key,None))
+    # one caller giving up should not cancel the check for the others
+    analysis = await asyncio.shield(task)
+    return copy.deepcopy(analysis)
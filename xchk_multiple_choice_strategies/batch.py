@@ -0,0 +1,65 @@
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('batch grading requires numpy, install xchk_multiple_choice_strategies[batch]')
+
+# upper bound on the number of cells in one (submissions x questions x options) block
+BLOCK_CELLS = 1 << 24
+
+def key_matrices(answer_key):
+    """Returns (questions x options) boolean matrices of correct and of hinted options."""
+    shape = (len(answer_key),max(answer_key.option_counts,default=0))
+    correct = np.zeros(shape,dtype=bool)
+    hinted = np.zeros(shape,dtype=bool)
+    for (q_idx,(correct_mask,hinted_mask,option_count)) in enumerate(zip(answer_key.correct,answer_key.hinted,answer_key.option_counts)):
+        for o_idx in range(option_count):
+            correct[q_idx,o_idx] = bool(correct_mask >> o_idx & 1)
+            hinted[q_idx,o_idx] = bool(hinted_mask >> o_idx & 1)
+    return (correct,hinted)
+
+def _flat_indexes(answer_key,s_idx,qas,q_count,o_count):
+    """Returns indexes into the flattened answer and presence matrices or `None`
+    if the answers are not numbered 1, 2, ... or use a letter beyond the options."""
+    answers = []
+    present = []
+    for (expected_idx,(q_number,letters)) in enumerate(qas,start=1):
+        if q_number != expected_idx or q_number > q_count:
+            return None
+        q_idx = q_number - 1
+        option_count = answer_key.option_counts[q_idx]
+        offset = (s_idx * q_count + q_idx) * o_count
+        for letter in letters:
+            o_idx = ord(letter.lower()) - ord('a')
+            if o_idx >= option_count:
+                return None
+            answers.append(offset + o_idx)
+        present.append(s_idx * q_count + q_idx)
+    return (answers,present)
+
+def passing(answer_key,qas_per_submission):
+    """Returns a boolean array which says, for each sequence of `(question_number, letters)`
+    pairs, whether `answer_key.grade` would find no errors in it."""
+    (correct,hinted) = key_matrices(answer_key)
+    (q_count,o_count) = correct.shape
+    outcomes = np.zeros(len(qas_per_submission),dtype=bool)
+    block_size = max(1,BLOCK_CELLS // max(1,q_count * o_count))
+    for start in range(0,len(qas_per_submission),block_size):
+        block = qas_per_submission[start:start + block_size]
+        given = np.zeros((len(block),q_count,o_count),dtype=bool)
+        present = np.zeros((len(block),q_count),dtype=bool)
+        regular = np.ones(len(block),dtype=bool)
+        answer_idxs = []
+        present_idxs = []
+        for (s_idx,qas) in enumerate(block):
+            indexes = _flat_indexes(answer_key,s_idx,qas,q_count,o_count)
+            if indexes is None:
+                # numbering or letter problems always lead to an error
+                regular[s_idx] = False
+            else:
+                answer_idxs.extend(indexes[0])
+                present_idxs.extend(indexes[1])
+        given.flat[answer_idxs] = True
+        present.flat[present_idxs] = True
+        wrong = ((given ^ correct) & hinted & present[:,:,np.newaxis]).any(axis=(1,2))
+        outcomes[start:start + len(block)] = regular & ~wrong
+    return outcomes
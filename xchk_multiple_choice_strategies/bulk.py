@@ -0,0 +1,120 @@
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib import import_module
+
+from .instrumentation import get_item_collector, set_item_collector
+from .parsing import grading_run
+from .strats import MultipleChoiceAnswerCheck, MultipleChoiceFormatCheck
+
+# check_submission only looks at content_uid, and only if no filename is given
+_Submission = namedtuple('_Submission',['content_uid'])
+
+def load_mc_data(spec):
+    """Loads `mc_data` from a JSON file or from a `module:attribute` specification."""
+    if spec.endswith('.json'):
+        with open(spec) as fh:
+            return json.load(fh)
+    (module_name,_,attribute) = spec.partition(':')
+    if not attribute:
+        raise ValueError(f'{spec} is neither a JSON file nor of the form module:attribute')
+    return getattr(import_module(module_name),attribute)
+
+def find_submissions(root,filename):
+    """Returns the sorted paths of all files named `filename` under `root`, relative to `root`."""
+    found = []
+    for (dirpath,_dirnames,filenames) in os.walk(root):
+        if filename in filenames:
+            found.append(os.path.relpath(os.path.join(dirpath,filename),root))
+    return sorted(found)
+
+def _ends_with_newline(path):
+    with open(path,'rb') as fh:
+        fh.seek(0,os.SEEK_END)
+        if fh.tell() == 0:
+            return True
+        fh.seek(-1,os.SEEK_END)
+        return fh.read(1) == b'\n'
+
+def already_graded(output_path):
+    """Returns the paths graded in an earlier (possibly interrupted) run.
+
+    Paths recorded with an error are left out, so they are tried again."""
+    graded = set()
+    if not os.path.exists(output_path):
+        return graded
+    with open(output_path) as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+                if 'error' not in record:
+                    graded.add(record['path'])
+            except (ValueError,KeyError):
+                # line cut off by an interrupted run
+                continue
+    return graded
+
+_worker_checks = None
+
+def _init_worker(filename,mc_data,item_analysis=False):
+    global _worker_checks
+    _worker_checks = (MultipleChoiceFormatCheck(filename=filename),
+                      MultipleChoiceAnswerCheck(filename=filename,mc_data=mc_data))
+    if item_analysis:
+        from .itemanalysis import ItemAnalysis
+        set_item_collector(ItemAnalysis())
+
+def _grade_one(root,rel_path):
+    (format_check,answer_check) = _worker_checks
+    student_path = os.path.join(root,os.path.dirname(rel_path))
+    record = {'path': rel_path}
+    try:
+        for (name,check) in (('format',format_check),('answers',answer_check)):
+            analysis = check.check_submission(_Submission(None),student_path,True,1,False)
+            record[name] = analysis.outcome
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+    return record
+
+def grade_chunk(root,rel_paths):
+    """Grades a chunk of submissions in a worker process, parsing each file only once.
+
+    Returns the records and, if the worker collects them, the item counts for the chunk."""
+    with grading_run(maxsize=len(rel_paths)):
+        records = [_grade_one(root,rel_path) for rel_path in rel_paths]
+    collector = get_item_collector()
+    if collector is None:
+        return (records,None)
+    snapshot = collector.snapshot()
+    collector.reset()
+    return (records,snapshot)
+
+def regrade(root,filename,mc_data,output_path,workers=None,chunk_size=50,progress=sys.stderr,item_analysis=None):
+    """Grades every file named `filename` under `root` and appends one JSON object per file to `output_path`.
+
+    Files which already have a record without an error in `output_path` are skipped, so an interrupted run can be resumed.
+    If `item_analysis` is an `ItemAnalysis`, the answers in the files graded in this run are counted in it.
+    Returns the number of files graded in this run."""
+    graded = already_graded(output_path)
+    pending = [rel_path for rel_path in find_submissions(root,filename) if rel_path not in graded]
+    chunks = [pending[start:start + chunk_size] for start in range(0,len(pending),chunk_size)]
+    done = 0
+    with open(output_path,'a') as out, \
+         ProcessPoolExecutor(max_workers=workers,initializer=_init_worker,initargs=(filename,mc_data,item_analysis is not None)) as executor:
+        if not _ends_with_newline(output_path):
+            # don't continue a line cut off by an interrupted run
+            out.write('\n')
+        futures = [executor.submit(grade_chunk,root,chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            (records,snapshot) = future.result()
+            if snapshot is not None:
+                item_analysis.merge(snapshot)
+            for record in records:
+                out.write(json.dumps(record) + '\n')
+            out.flush()
+            done += len(records)
+            if progress is not None:
+                progress.write(f'{done}/{len(pending)} submissions graded\n')
+    return done
@@ -0,0 +1,138 @@
+import json
+import threading
+from time import perf_counter
+
+class CheckMetrics:
+    """What was measured during a single call to `check_submission`.
+
+    `phases` maps phase names ('read', 'lookup', 'scan', 'lex', 'parse', 'grade', 'outcome')
+    to durations in seconds, in the order in which they ran. Phases which were
+    skipped, e.g. because the outcome was cached, are left out, as are counts
+    that were not determined. When the answer check reads a submission only
+    as far as needed to decide its outcome, 'grade' includes the scanning."""
+
+    __slots__ = ('check','phases','file_size','token_count','question_count')
+
+    def __init__(self,check,phases,file_size=None,token_count=None,question_count=None):
+        self.check = check
+        self.phases = phases
+        self.file_size = file_size
+        self.token_count = token_count
+        self.question_count = question_count
+
+class NullTimer:
+
+    def lap(self,phase):
+        pass
+
+    def report(self,check,content,parsed=None):
+        pass
+
+NULL_TIMER = NullTimer()
+
+class PhaseTimer:
+
+    def __init__(self,sink):
+        self.sink = sink
+        self.phases = {}
+        self._last = perf_counter()
+
+    def lap(self,phase):
+        now = perf_counter()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def report(self,check,content,parsed=None):
+        metrics = CheckMetrics(check,self.phases)
+        if content.data is not None:
+            metrics.file_size = len(content.data)
+        if parsed is not None:
+            metrics.question_count = len(parsed.qas)
+            if parsed.token_count is not None:
+                metrics.token_count = parsed.token_count
+            elif parsed.rejection is None:
+                # the scanner does not count, but it accepts one INT and some LETTERs per question
+                metrics.token_count = sum(1 + len(letters) for (_q_number,letters) in parsed.qas)
+        self.sink(metrics)
+
+_sink = None
+
+def set_metrics_sink(sink):
+    """Makes the checks call `sink` with a `CheckMetrics` object after every check.
+    `None`, the default, turns measuring off."""
+    global _sink
+    _sink = sink
+
+def start_timer():
+    sink = _sink
+    return NULL_TIMER if sink is None else PhaseTimer(sink)
+
+_item_collector = None
+
+def set_item_collector(collector):
+    """Makes the answer check pass the answers in every submission it grades to
+    `collector.record`, e.g. an `itemanalysis.ItemAnalysis`. `None`, the default,
+    turns collecting off."""
+    global _item_collector
+    _item_collector = collector
+
+def get_item_collector():
+    return _item_collector
+
+class Histogram:
+    """Counts values in buckets whose upper bounds are powers of two."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self,value):
+        bucket = 1 << int(value).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket,0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max,value)
+
+    def as_dict(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'max': self.max,
+                'buckets': {f'<{bound}': n for (bound,n) in sorted(self.buckets.items())}}
+
+class HistogramSink:
+    """Metrics sink which aggregates everything in memory.
+
+    Durations are recorded in microseconds, per check and phase."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def _add(self,name,value):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram()
+        histogram.add(value)
+
+    def __call__(self,metrics):
+        with self._lock:
+            for (phase,duration) in metrics.phases.items():
+                self._add(f'{metrics.check}.{phase}_us',duration * 1e6)
+            self._add(f'{metrics.check}.total_us',sum(metrics.phases.values()) * 1e6)
+            for name in ('file_size','token_count','question_count'):
+                value = getattr(metrics,name)
+                if value is not None:
+                    self._add(f'{metrics.check}.{name}',value)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.as_dict() for (name,histogram) in sorted(self._histograms.items())}
+
+    def dump(self,fh):
+        json.dump(self.snapshot(),fh,indent=2)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
@@ -0,0 +1,132 @@
+import csv
+import json
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError('item analysis requires numpy, install xchk_multiple_choice_strategies[itemanalysis]')
+
+class ItemCounts:
+    """Counters for one answer key.
+
+    `chosen[q,o]` is how many submissions chose option `o` of question `q` (both
+    counted from 0), `correct[q]` and `incorrect[q]` how many answered question
+    `q` without and with errors. Submissions which skipped question `q` are in
+    neither of these. `submissions` and `passed` count whole submissions."""
+
+    def __init__(self,option_counts):
+        self.option_counts = tuple(option_counts)
+        self.chosen = np.zeros((len(self.option_counts),max(self.option_counts,default=0)),dtype=np.int64)
+        self.correct = np.zeros(len(self.option_counts),dtype=np.int64)
+        self.incorrect = np.zeros(len(self.option_counts),dtype=np.int64)
+        self.submissions = 0
+        self.passed = 0
+
+    def add(self,answer_key,qas,passed):
+        chosen_q_idxs = []
+        chosen_o_idxs = []
+        correct_q_idxs = []
+        incorrect_q_idxs = []
+        for (q_number,letters) in qas:
+            if not 0 < q_number <= len(self.option_counts):
+                continue
+            q_idx = q_number - 1
+            option_count = self.option_counts[q_idx]
+            for letter in set(letters.lower()):
+                o_idx = ord(letter) - ord('a')
+                if o_idx < option_count:
+                    chosen_q_idxs.append(q_idx)
+                    chosen_o_idxs.append(o_idx)
+            # judged on its own, regardless of the numbering of the other answers
+            if answer_key.qa_passes(q_number,q_number,letters):
+                correct_q_idxs.append(q_idx)
+            else:
+                incorrect_q_idxs.append(q_idx)
+        # one update per array rather than per answer
+        np.add.at(self.chosen,(np.array(chosen_q_idxs,dtype=np.intp),np.array(chosen_o_idxs,dtype=np.intp)),1)
+        np.add.at(self.correct,np.array(correct_q_idxs,dtype=np.intp),1)
+        np.add.at(self.incorrect,np.array(incorrect_q_idxs,dtype=np.intp),1)
+        self.submissions += 1
+        self.passed += bool(passed)
+
+    def merge(self,other):
+        if other.option_counts != self.option_counts:
+            raise ValueError('cannot merge counts for answer keys with different questions')
+        self.chosen += other.chosen
+        self.correct += other.correct
+        self.incorrect += other.incorrect
+        self.submissions += other.submissions
+        self.passed += other.passed
+
+    def copy(self):
+        counts = ItemCounts(self.option_counts)
+        counts.merge(self)
+        return counts
+
+class ItemAnalysis:
+    """Collects `ItemCounts` per exercise while submissions are graded.
+
+    Register an instance with `instrumentation.set_item_collector`. Exercises are
+    identified by the `exercise_id` of the check, if any, and the fingerprint of
+    the answer key, so counts for an exercise whose key changed are kept apart.
+    Snapshots can be pickled, so workers can send them to one process which
+    merges them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self,exercise_id,answer_key,qas,passed):
+        with self._lock:
+            counts = self._counts.get((exercise_id,answer_key.fingerprint))
+            if counts is None:
+                counts = self._counts[(exercise_id,answer_key.fingerprint)] = ItemCounts(answer_key.option_counts)
+            counts.add(answer_key,qas,passed)
+
+    def snapshot(self):
+        """Returns a copy of the counts, keyed on `(exercise_id, fingerprint)`."""
+        with self._lock:
+            return {key: counts.copy() for (key,counts) in self._counts.items()}
+
+    def merge(self,snapshot):
+        """Adds the counts in `snapshot`, as returned by `snapshot`, to these."""
+        with self._lock:
+            for (key,counts) in snapshot.items():
+                if key in self._counts:
+                    self._counts[key].merge(counts)
+                else:
+                    self._counts[key] = counts.copy()
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def as_dict(self):
+        exercises = []
+        for ((exercise_id,fingerprint),counts) in sorted(self.snapshot().items(),key=lambda item: (item[0][0] or '',item[0][1])):
+            questions = []
+            for (q_idx,option_count) in enumerate(counts.option_counts):
+                questions.append({'question': q_idx + 1,
+                                  'correct': int(counts.correct[q_idx]),
+                                  'incorrect': int(counts.incorrect[q_idx]),
+                                  'chosen': {chr(ord('a') + o_idx): int(counts.chosen[q_idx,o_idx]) for o_idx in range(option_count)}})
+            exercises.append({'exercise_id': exercise_id,
+                              'fingerprint': fingerprint,
+                              'submissions': counts.submissions,
+                              'passed': counts.passed,
+                              'questions': questions})
+        return {'exercises': exercises}
+
+    def dump_json(self,fh):
+        json.dump(self.as_dict(),fh,indent=2)
+
+    def dump_csv(self,fh):
+        """Writes one row per option."""
+        writer = csv.writer(fh)
+        writer.writerow(['exercise_id','fingerprint','question','option','chosen','question_correct','question_incorrect','submissions'])
+        for exercise in self.as_dict()['exercises']:
+            for question in exercise['questions']:
+                for (option,chosen) in question['chosen'].items():
+                    writer.writerow([exercise['exercise_id'] or '',exercise['fingerprint'],question['question'],option,chosen,
+                                     question['correct'],question['incorrect'],exercise['submissions']])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from xchk_multiple_choice_strategies.bulk import load_mc_data
+from xchk_multiple_choice_strategies.registry import build_registry
+
+class Command(BaseCommand):
+    help = "Writes the mc_data of many exercises to a single file which checks can look up by exercise id."
+
+    def add_arguments(self,parser):
+        parser.add_argument('banks',help='JSON file or module:attribute containing a mapping of exercise ids to mc_data')
+        parser.add_argument('output',help='registry file, replaced atomically (point XCHK_MC_ANSWER_KEY_REGISTRY at it)')
+
+    def handle(self,*args,**options):
+        try:
+            banks = load_mc_data(options['banks'])
+            build_registry(options['output'],banks)
+        except (OSError,ValueError,ImportError,AttributeError) as e:
+            raise CommandError(f"Could not build {options['output']}: {e}")
+        self.stdout.write(f"Wrote {len(banks)} exercises to {options['output']}.")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from xchk_multiple_choice_strategies.bulk import load_mc_data, regrade
+
+class Command(BaseCommand):
+    help = "Grades every multiple choice submission in a directory tree of student folders and writes the outcomes as JSON Lines."
+
+    def add_arguments(self,parser):
+        parser.add_argument('mc_data',help='JSON file or module:attribute containing the mc_data of the exercise')
+        parser.add_argument('root',help='directory containing one folder per student')
+        parser.add_argument('--filename',required=True,help='name of the submitted file in each student folder')
+        parser.add_argument('--output',required=True,help='JSON Lines file, files already recorded in it are skipped')
+        parser.add_argument('--workers',type=int,default=None,help='number of worker processes (default: one per core)')
+        parser.add_argument('--chunk-size',type=int,default=50,help='number of submissions handed to a worker at once')
+        parser.add_argument('--item-analysis',default=None,help='CSV or JSON file to write how often each option was chosen to (requires numpy)')
+
+    def handle(self,*args,**options):
+        try:
+            mc_data = load_mc_data(options['mc_data'])
+        except (OSError,ValueError,ImportError,AttributeError) as e:
+            raise CommandError(f"Could not load {options['mc_data']}: {e}")
+        item_analysis = None
+        if options['item_analysis'] is not None:
+            from xchk_multiple_choice_strategies.itemanalysis import ItemAnalysis
+            item_analysis = ItemAnalysis()
+        done = regrade(options['root'],
+                       options['filename'],
+                       mc_data,
+                       options['output'],
+                       workers=options['workers'],
+                       chunk_size=options['chunk_size'],
+                       progress=self.stderr,
+                       item_analysis=item_analysis)
+        if item_analysis is not None:
+            with open(options['item_analysis'],'w',newline='') as fh:
+                if options['item_analysis'].endswith('.csv'):
+                    item_analysis.dump_csv(fh)
+                else:
+                    item_analysis.dump_json(fh)
+        self.stdout.write(f'Graded {done} submissions.')
@@ -0,0 +1,92 @@
+import sys
+import weakref
+from collections import namedtuple
+
+def _intern(text):
+    return sys.intern(text) if isinstance(text,str) else text
+
+class Option(namedtuple('Option',['text','correct','hint'])):
+    __slots__ = ()
+
+    def __new__(cls,text,correct,hint=None):
+        return super().__new__(cls,_intern(text),bool(correct),_intern(hint) or None)
+
+class Question(namedtuple('Question',['text','options'])):
+    __slots__ = ()
+
+    def __new__(cls,text,options):
+        options = tuple(option if isinstance(option,Option) else Option(*option) for option in options)
+        if not options:
+            raise ValueError(f'question {text!r} has no options')
+        return super().__new__(cls,_intern(text),options)
+
+class QuestionBank:
+    """The questions of one exercise.
+
+    Use `question_bank` rather than the constructor, so that identical banks
+    are shared between checks. Do not modify a bank once it is created."""
+
+    __slots__ = ('questions','_answer_key','__weakref__')
+
+    def __init__(self,questions):
+        self.questions = tuple(questions)
+        self._answer_key = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def __getitem__(self,idx):
+        return self.questions[idx]
+
+    def __eq__(self,other):
+        return isinstance(other,QuestionBank) and self.questions == other.questions
+
+    def __hash__(self):
+        return hash(self.questions)
+
+    def __repr__(self):
+        return f'QuestionBank({list(self.questions)!r})'
+
+    def __reduce__(self):
+        return (question_bank,(self.questions,))
+
+    def answer_key(self):
+        """Returns the compiled `AnswerKey` for this bank, compiling it on first use."""
+        if self._answer_key is None:
+            from .answerkey import AnswerKey
+            self._answer_key = AnswerKey(self)
+        return self._answer_key
+
+def _legacy_question(q_idx,question):
+    if isinstance(question,Question):
+        return question
+    if not isinstance(question,(tuple,list)) or len(question) < 2:
+        raise ValueError(f'question {q_idx} should consist of a text and at least one option')
+    options = []
+    for (o_idx,option) in enumerate(question[1:],start=1):
+        if isinstance(option,Option):
+            options.append(option)
+        elif isinstance(option,(tuple,list)) and len(option) == 3:
+            options.append(Option(*option))
+        else:
+            raise ValueError(f'option {o_idx} of question {q_idx} should be a (text, truth, hint) tuple')
+    return Question(question[0],options)
+
+_banks = weakref.WeakValueDictionary()
+
+def question_bank(mc_data):
+    """Returns the `QuestionBank` for `mc_data`, which may also be a sequence of
+    `Question` objects or of legacy `(question, (text, truth, hint), ...)` tuples.
+
+    As long as a bank with the same content is in use, that bank is returned."""
+    if isinstance(mc_data,QuestionBank):
+        return mc_data
+    questions = tuple(_legacy_question(q_idx,question) for (q_idx,question) in enumerate(mc_data,start=1))
+    bank = _banks.get(questions)
+    if bank is None:
+        bank = QuestionBank(questions)
+        _banks[questions] = bank
+    return bank
@@ -0,0 +1,236 @@
+import hashlib
+import threading
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .instrumentation import NULL_TIMER
+from .scanner import LEXICAL, ScanRejected, qa_positions as scan_positions, scan_or_raise
+
+# reasons for rejecting a submission before it is parsed
+TOO_LARGE = 'too_large'
+NOT_ASCII = 'not_ascii'
+
+DEFAULT_MAX_SUBMISSION_SIZE = 1 << 20
+
+DEFAULT_PARSE_CACHE_SIZE = 256
+
+class ParseResult(namedtuple('ParseResult',['syntax_errors','qas','rejection','token_count','positions'],defaults=[None,None,None])):
+
+    @property
+    def well_formed(self):
+        return self.rejection is None and self.syntax_errors == 0
+
+def max_submission_size():
+    """Returns the `XCHK_MC_MAX_SUBMISSION_SIZE` setting (in bytes), if Django is configured."""
+    from django.conf import settings
+    if settings.configured:
+        return getattr(settings,'XCHK_MC_MAX_SUBMISSION_SIZE',DEFAULT_MAX_SUBMISSION_SIZE)
+    return DEFAULT_MAX_SUBMISSION_SIZE
+
+def read_submission(path,max_size):
+    """Returns the bytes of the submission at `path` and a reason to reject it, if there is one.
+
+    At most `max_size + 1` bytes are read."""
+    with open(path,'rb') as fh:
+        data = fh.read(max_size + 1)
+    if len(data) > max_size:
+        return (None,TOO_LARGE)
+    if not data.isascii():
+        return (None,NOT_ASCII)
+    return (data,None)
+
+def parse(data,timer=NULL_TIMER):
+    """Parses the bytes of a submission, using the ANTLR pipeline only if the scanner rejects them."""
+    try:
+        qas = scan_or_raise(data)
+    except ScanRejected as rejected:
+        timer.lap('scan')
+        return parse_with_antlr(data,timer,try_sll=rejected.reason == LEXICAL)
+    timer.lap('scan')
+    return ParseResult(syntax_errors=0,qas=qas)
+
+SubmissionContent = namedtuple('SubmissionContent',['data','rejection','digest'])
+
+def load_submission(path):
+    """Reads the submission at `path` and identifies it by a digest of its content.
+
+    Rejected submissions are identified by the reason for rejecting them,
+    as that is all that determines their outcome."""
+    (data,rejection) = read_submission(path,max_submission_size())
+    if rejection is not None:
+        return SubmissionContent(data=None,rejection=rejection,digest=rejection)
+    return SubmissionContent(data=data,rejection=None,digest=hashlib.sha256(data).hexdigest())
+
+class ParseCache:
+    """Bounded LRU mapping of content digests to `ParseResult`."""
+
+    def __init__(self,maxsize=DEFAULT_PARSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # checks may run in several threads at once, see asyncchecks
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self,key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def put(self,key,result):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_parse_cache = None
+
+def get_parse_cache():
+    """Returns the process-wide cache through which checks outside a grading run share
+    parse results, sized by the `XCHK_MC_PARSE_CACHE_SIZE` setting on first use.
+
+    Results are keyed on a digest of the content, so a modified file is parsed again.
+    A size of 0 turns sharing off."""
+    global _parse_cache
+    if _parse_cache is None:
+        from django.conf import settings
+        maxsize = DEFAULT_PARSE_CACHE_SIZE
+        if settings.configured:
+            maxsize = getattr(settings,'XCHK_MC_PARSE_CACHE_SIZE',DEFAULT_PARSE_CACHE_SIZE)
+        _parse_cache = ParseCache(maxsize)
+    return _parse_cache
+
+def set_parse_cache(cache):
+    global _parse_cache
+    _parse_cache = cache
+
+_active_cache = ContextVar('xchk_mc_parse_cache',default=None)
+
+@contextmanager
+def grading_run(maxsize=DEFAULT_PARSE_CACHE_SIZE):
+    """Shares parse results between all checks run inside the `with` block
+    through a cache of their own, rather than the process-wide one.
+
+    Nested runs reuse the outermost cache."""
+    cache = _active_cache.get()
+    if cache is not None:
+        yield cache
+        return
+    cache = ParseCache(maxsize)
+    token = _active_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _active_cache.reset(token)
+
+def in_grading_run():
+    return _active_cache.get() is not None
+
+def _shared_cache():
+    cache = _active_cache.get()
+    if cache is None:
+        cache = get_parse_cache()
+    return cache if cache.maxsize > 0 else None
+
+def cached_parse(content):
+    """Returns the `ParseResult` shared for `content` by an earlier check, if there is one."""
+    cache = _shared_cache()
+    if cache is None or content.rejection is not None:
+        return None
+    return cache.get(content.digest)
+
+def parse_content(content,timer=NULL_TIMER):
+    """Parses a loaded submission, reusing the result for identical content
+    parsed earlier in the same grading run or, outside one, in this process."""
+    if content.rejection is not None:
+        return ParseResult(syntax_errors=0,qas=[],rejection=content.rejection)
+    cache = _shared_cache()
+    if cache is None:
+        return parse(content.data,timer)
+    result = cache.get(content.digest)
+    if result is None:
+        result = parse(content.data,timer)
+        cache.put(content.digest,result)
+    return result
+
+def parse_file(path):
+    return parse_content(load_submission(path))
+
+def qa_positions(content,parsed):
+    """Returns the `(line, column)` of each answer in `parsed`, the `ParseResult` for `content`.
+
+    The scanner does not keep track of them, so they are only looked up when needed."""
+    if parsed.positions is not None:
+        return parsed.positions
+    if content.rejection is not None:
+        return []
+    return scan_positions(content.data)
+
+def parse_with_antlr(data,timer=NULL_TIMER,try_sll=False):
+    """Parses `data` with ANTLR's error recovery.
+
+    With `try_sll`, the cheaper SLL prediction is tried first, giving up at the first
+    syntax error. That only pays off for input whose sole problem the lexer
+    gets past, such as a stray character. For other input it gives up and
+    the tokens are parsed a second time."""
+    # the ANTLR runtime and the generated modules are expensive to import
+    # and only needed for submissions the scanner rejects
+    from antlr4 import CommonTokenStream
+    from antlr4.atn.PredictionMode import PredictionMode
+    from antlr4.error.ErrorStrategy import BailErrorStrategy, DefaultErrorStrategy
+    from antlr4.error.Errors import ParseCancellationException
+    from .MultipleChoiceLexer import MultipleChoiceLexer
+    from .MultipleChoiceParser import MultipleChoiceParser
+    from .MultipleChoiceCollector import MultipleChoiceCollector
+    from .ByteCharStream import ByteCharStream
+    lexer = MultipleChoiceLexer(ByteCharStream(data))
+    lexer.removeErrorListeners()
+    token_stream = CommonTokenStream(lexer)
+    token_stream.fill()
+    timer.lap('lex')
+    parser = MultipleChoiceParser(token_stream)
+    parser.removeErrorListeners()
+    # answers are picked up while parsing instead of from a parse tree
+    # tokens conjured up during error recovery are then left out as well
+    parser.buildParseTrees = False
+    collector = MultipleChoiceCollector()
+    parser.addParseListener(collector)
+    if try_sll:
+        parser._interp.predictionMode = PredictionMode.SLL
+        parser._errHandler = BailErrorStrategy()
+        try:
+            parser.multiplechoice()
+        except ParseCancellationException:
+            # Parser.reset() fails while parse listeners are attached
+            parser.removeParseListeners()
+            parser.reset()
+            parser._interp.predictionMode = PredictionMode.LL
+            parser._errHandler = DefaultErrorStrategy()
+            collector = MultipleChoiceCollector()
+            parser.addParseListener(collector)
+            parser.multiplechoice()
+    else:
+        parser.multiplechoice()
+    timer.lap('parse')
+    # the last token is EOF
+    return ParseResult(syntax_errors=parser.getNumberOfSyntaxErrors(),qas=collector.qas,token_count=len(token_stream.tokens) - 1,positions=collector.positions)
+
+# exercises the lexer rules, comments and the error recovery paths
+_WARM_UP_TEXT = b'// warm-up\r\n1 a B\n2 c // commentaar\n3 ? d 4\n5 e 6 // zonder einde'
+
+def warm_up():
+    """Fills the DFA caches shared by all lexer and parser instances, so the
+    first real submission that needs ANTLR does not pay for building them."""
+    parse_with_antlr(_WARM_UP_TEXT,try_sll=True)
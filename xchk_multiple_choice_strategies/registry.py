@@ -0,0 +1,186 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from .model import Option, Question, question_bank
+
+# magic, format version, number of exercises
+_HEADER = struct.Struct('<4sHxxI')
+# id offset, id length, record offset, record length, all relative to the start of the file
+_ENTRY = struct.Struct('<QIQI')
+_MAGIC = b'XMCK'
+_VERSION = 1
+_COUNT = struct.Struct('<I')
+_CORRECT = 1
+_HINTED = 2
+
+def _encode_text(text):
+    encoded = text.encode('utf-8')
+    return _COUNT.pack(len(encoded)) + encoded
+
+def _encode_bank(bank):
+    parts = [_COUNT.pack(len(bank))]
+    for question in bank:
+        parts.append(_encode_text(question.text))
+        parts.append(_COUNT.pack(len(question.options)))
+        for option in question.options:
+            flags = (_CORRECT if option.correct else 0) | (_HINTED if option.hint else 0)
+            parts.append(bytes([flags]))
+            parts.append(_encode_text(option.text))
+            if option.hint:
+                parts.append(_encode_text(option.hint))
+    return b''.join(parts)
+
+def _decode_text(buffer,offset):
+    (length,) = _COUNT.unpack_from(buffer,offset)
+    offset += _COUNT.size
+    return (buffer[offset:offset + length].decode('utf-8'),offset + length)
+
+def _decode_bank(buffer,offset):
+    (question_count,) = _COUNT.unpack_from(buffer,offset)
+    offset += _COUNT.size
+    questions = []
+    for _ in range(question_count):
+        (text,offset) = _decode_text(buffer,offset)
+        (option_count,) = _COUNT.unpack_from(buffer,offset)
+        offset += _COUNT.size
+        options = []
+        for _ in range(option_count):
+            flags = buffer[offset]
+            (option_text,offset) = _decode_text(buffer,offset + 1)
+            hint = None
+            if flags & _HINTED:
+                (hint,offset) = _decode_text(buffer,offset)
+            options.append(Option(option_text,flags & _CORRECT,hint))
+        questions.append(Question(text,options))
+    return question_bank(questions)
+
+def build_registry(path,banks):
+    """Writes the question banks in `banks`, a mapping of exercise ids to `mc_data`, to `path`.
+
+    The file is written next to `path` and then renamed, so processes which
+    have the old file open keep using it until they notice the new one."""
+    encoded = sorted((exercise_id.encode('utf-8'),_encode_bank(question_bank(mc_data))) for (exercise_id,mc_data) in banks.items())
+    offset = _HEADER.size + _ENTRY.size * len(encoded)
+    index = []
+    for (encoded_id,record) in encoded:
+        index.append(_ENTRY.pack(offset,len(encoded_id),offset + len(encoded_id),len(record)))
+        offset += len(encoded_id) + len(record)
+    (fd,tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),prefix='.answerkeys-')
+    try:
+        with os.fdopen(fd,'wb') as fh:
+            fh.write(_HEADER.pack(_MAGIC,_VERSION,len(encoded)))
+            fh.writelines(index)
+            for (encoded_id,record) in encoded:
+                fh.write(encoded_id)
+                fh.write(record)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.chmod(tmp_path,0o644)
+        os.replace(tmp_path,path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+class AnswerKeyRegistry:
+    """Read-only view of a file written by `build_registry`.
+
+    The file is memory-mapped, so all processes on a machine share one copy of it.
+    Question banks are decoded on first lookup. When the file is replaced, the
+    next lookup maps the new file."""
+
+    def __init__(self,path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mapping = None
+        self._stat = None
+        self._count = 0
+        self._banks = {}
+
+    def _current(self):
+        stat = os.stat(self.path)
+        signature = (stat.st_ino,stat.st_mtime_ns,stat.st_size)
+        if signature != self._stat:
+            with self._lock:
+                if signature != self._stat:
+                    self._remap(signature)
+
+    def _remap(self,signature):
+        with open(self.path,'rb') as fh:
+            mapping = mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+        (magic,version,count) = _HEADER.unpack_from(mapping,0)
+        if magic != _MAGIC or version != _VERSION:
+            mapping.close()
+            raise ValueError(f'{self.path} is not an answer key registry')
+        if self._mapping is not None:
+            self._mapping.close()
+        self._mapping = mapping
+        self._count = count
+        self._banks = {}
+        self._stat = signature
+
+    def _find(self,mapping,encoded_id):
+        (low,high) = (0,self._count)
+        while low < high:
+            middle = (low + high) // 2
+            (id_offset,id_length,record_offset,_record_length) = _ENTRY.unpack_from(mapping,_HEADER.size + middle * _ENTRY.size)
+            found = mapping[id_offset:id_offset + id_length]
+            if found == encoded_id:
+                return record_offset
+            if found < encoded_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get(self,exercise_id):
+        """Returns the `QuestionBank` of `exercise_id` or raises `KeyError`."""
+        self._current()
+        bank = self._banks.get(exercise_id)
+        if bank is None:
+            with self._lock:
+                bank = self._banks.get(exercise_id)
+                if bank is None:
+                    record_offset = self._find(self._mapping,exercise_id.encode('utf-8'))
+                    if record_offset is None:
+                        raise KeyError(exercise_id)
+                    bank = self._banks[exercise_id] = _decode_bank(self._mapping,record_offset)
+        return bank
+
+    def __contains__(self,exercise_id):
+        try:
+            self.get(exercise_id)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        self._current()
+        return self._count
+
+    def close(self):
+        with self._lock:
+            if self._mapping is not None:
+                self._mapping.close()
+            self._mapping = None
+            self._stat = None
+            self._banks = {}
+
+_registry = None
+
+def get_registry():
+    """Returns the process-wide registry, at the path in the `XCHK_MC_ANSWER_KEY_REGISTRY` setting."""
+    global _registry
+    if _registry is None:
+        from django.conf import settings
+        path = getattr(settings,'XCHK_MC_ANSWER_KEY_REGISTRY',None)
+        if path is None:
+            raise LookupError('the XCHK_MC_ANSWER_KEY_REGISTRY setting is required to look up exercises by id')
+        _registry = AnswerKeyRegistry(path)
+    return _registry
+
+def set_registry(registry):
+    global _registry
+    _registry = registry
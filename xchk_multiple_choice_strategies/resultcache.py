@@ -0,0 +1,111 @@
+import copy
+import pickle
+import threading
+from collections import OrderedDict
+
+DEFAULT_RESULT_CACHE_SIZE = 4096
+
+class DjangoCacheBackend:
+    """Stores outcomes in one of Django's caches, so they are shared between worker processes.
+
+    Any configured cache works, e.g. a database or file based one for a persistent store."""
+
+    def __init__(self,alias='default',timeout=None,prefix='xchk_mc_result:'):
+        self.alias = alias
+        self.timeout = timeout
+        self.prefix = prefix
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self,key):
+        pickled = self._cache().get(self.prefix + key)
+        return None if pickled is None else pickle.loads(pickled)
+
+    def set(self,key,value):
+        self._cache().set(self.prefix + key,pickle.dumps(value),timeout=self.timeout)
+
+class ResultCache:
+    """LRU cache of `OutcomeAnalysis` objects, keyed on submission content and check parameters.
+
+    Entries that are not in memory are looked up in `backend`, if there is one."""
+
+    def __init__(self,maxsize=DEFAULT_RESULT_CACHE_SIZE,backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # checks may run in several threads at once, see asyncchecks
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(check_kind,content_digest,check_digest,desired_outcome,init_check_number,ancestor_has_alternatives):
+        return f'{check_kind}:{content_digest}:{check_digest}:{int(desired_outcome)}:{init_check_number}:{int(ancestor_has_alternatives)}'
+
+    def get(self,key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        if value is None:
+            value = self.backend.get(key) if self.backend is not None else None
+            if value is None:
+                with self._lock:
+                    self.misses += 1
+                return None
+            self._remember(key,value)
+        with self._lock:
+            self.hits += 1
+        # callers may modify what they get back
+        return copy.deepcopy(value)
+
+    def put(self,key,value):
+        value = copy.deepcopy(value)
+        self._remember(key,value)
+        if self.backend is not None:
+            self.backend.set(key,value)
+
+    def _remember(self,key,value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits,'misses': self.misses,'size': len(self._entries),'maxsize': self.maxsize}
+
+_result_cache = None
+
+def get_result_cache():
+    """Returns the process-wide cache, configured through the `XCHK_MC_RESULT_CACHE_SIZE`
+    and `XCHK_MC_RESULT_CACHE_ALIAS` settings on first use."""
+    global _result_cache
+    if _result_cache is None:
+        from django.conf import settings
+        maxsize = DEFAULT_RESULT_CACHE_SIZE
+        backend = None
+        if settings.configured:
+            maxsize = getattr(settings,'XCHK_MC_RESULT_CACHE_SIZE',DEFAULT_RESULT_CACHE_SIZE)
+            alias = getattr(settings,'XCHK_MC_RESULT_CACHE_ALIAS',None)
+            if alias is not None:
+                backend = DjangoCacheBackend(alias)
+        _result_cache = ResultCache(maxsize,backend)
+    return _result_cache
+
+def set_result_cache(cache):
+    global _result_cache
+    _result_cache = cache
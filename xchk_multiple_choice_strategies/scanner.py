@@ -0,0 +1,97 @@
+import re
+
+# one alternative per token of MultipleChoice.g4
+# WS and LINE_COMMENT are skipped, anything else ends up in the last group
+_TOKENS = re.compile(rb'([0-9]+)|([A-Za-z]+)|[ \t\r\n]+|//[^\n]*\n|(.)',re.DOTALL)
+
+# int() refuses more digits than sys.get_int_max_str_digits(), which can be set as low as this
+MAX_QUESTION_DIGITS = 640
+# stands in for numbers with more digits, grades as an invalid question
+QUESTION_OUT_OF_RANGE = 10 ** MAX_QUESTION_DIGITS
+
+def question_number(digits):
+    """Converts the digits of an INT token, as `str` or `bytes`, to a question number.
+
+    Numbers with more digits than `int` is sure to convert become `QUESTION_OUT_OF_RANGE`,
+    which is larger than any other number."""
+    if len(digits) > MAX_QUESTION_DIGITS:
+        digits = digits.lstrip(b'0' if isinstance(digits,bytes) else '0')
+        if len(digits) > MAX_QUESTION_DIGITS:
+            return QUESTION_OUT_OF_RANGE
+    return int(digits) if digits else 0
+
+# reasons for rejecting input, see ScanRejected
+LEXICAL = 'lexical'
+SYNTACTIC = 'syntactic'
+
+class ScanRejected(Exception):
+    """Raised for input outside the MultipleChoice language.
+
+    `reason` is `LEXICAL` if the first problem is a character the ANTLR lexer
+    skips, e.g. a stray character or a comment without a newline after it,
+    and `SYNTACTIC` if it is a token in the wrong place."""
+
+    def __init__(self,reason=SYNTACTIC):
+        super().__init__(reason)
+        self.reason = reason
+
+def _qas(tokens):
+    letters = None
+    for (number,more_letters,invalid) in tokens:
+        if number:
+            if letters == b'':
+                raise ScanRejected()
+            if letters is not None:
+                yield (question,letters.decode('ascii'))
+            question = question_number(number)
+            letters = b''
+        elif more_letters:
+            if letters is None:
+                raise ScanRejected()
+            letters += more_letters
+        elif invalid:
+            raise ScanRejected(LEXICAL)
+    if not letters:
+        raise ScanRejected()
+    yield (question,letters.decode('ascii'))
+
+def scan_or_raise(data):
+    """Like `scan`, but raises `ScanRejected` rather than returning `None`."""
+    return list(_qas(_TOKENS.findall(data)))
+
+def scan(data):
+    """Recognizes the ASCII bytes `data` without going through the ANTLR runtime.
+
+    Returns a list of `(question_number, letters)` pairs if the data belong to the
+    MultipleChoice language and `None` otherwise. Input that is rejected here may
+    still be accepted by the ANTLR parser after error recovery (e.g. a stray
+    character is skipped by the lexer), so callers should fall back to it."""
+    try:
+        return scan_or_raise(data)
+    except ScanRejected:
+        return None
+
+def iter_scan(data):
+    """Lazy version of `scan`, which yields each pair as soon as the next question starts.
+
+    Raises `ScanRejected` when it reaches input that `scan` would reject, so the
+    pairs yielded up to that point are also what the ANTLR parser finds."""
+    return _qas(map(re.Match.groups,_TOKENS.finditer(data)))
+
+def qa_positions(data):
+    """Returns the `(line, column)` at which each pair that `scan` returns for `data` starts,
+    counted as by ANTLR: lines from 1, columns from 0."""
+    positions = []
+    line = 1
+    line_start = 0
+    last = 0
+    for match in _TOKENS.finditer(data):
+        if match.group(1):
+            start = match.start()
+            newlines = data.count(b'\n',last,start)
+            if newlines:
+                line += newlines
+                line_start = data.rindex(b'\n',last,start) + 1
+            positions.append((line,start - line_start))
+            last = start
+    return positions
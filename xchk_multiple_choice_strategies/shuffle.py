@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+_MASK = (1 << 64) - 1
+
+def splitmix64(x):
+    """Mixes a 64-bit integer, see https://prng.di.unimi.it/splitmix64.c."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+def seed_value(seed):
+    """Turns an integer or string seed into a 64-bit integer."""
+    if isinstance(seed,str):
+        return int.from_bytes(hashlib.sha256(seed.encode('utf-8')).digest()[:8],'little')
+    return seed & _MASK
+
+def option_order(seed,q_idx,option_count):
+    """Returns the indexes of the options of question `q_idx` (counted from 0) in the order
+    in which they are shown for `seed`.
+
+    Options are sorted on a hash of the seed, the question and the option, so the
+    order only depends on these and does not change between Python versions."""
+    base = splitmix64(seed_value(seed) ^ splitmix64(q_idx))
+    keys = [splitmix64(base ^ o_idx) for o_idx in range(option_count)]
+    return sorted(range(option_count),key=keys.__getitem__)
+
+def permutation_table(seeds,option_counts):
+    """Returns a (seeds x questions x options) array whose `[s,q]` row is
+    `option_order(seeds[s],q,option_counts[q])`, padded with the indexes of
+    options question `q` does not have. Requires numpy."""
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('computing permutation tables requires numpy, install xchk_multiple_choice_strategies[batch]')
+    def mix(x):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+    option_counts = np.asarray(option_counts,dtype=np.int64)
+    o_count = int(option_counts.max(initial=0))
+    seed_values = np.array([seed_value(seed) for seed in seeds],dtype=np.uint64)
+    bases = mix(seed_values[:,np.newaxis] ^ mix(np.arange(len(option_counts),dtype=np.uint64))[np.newaxis,:])
+    keys = mix(bases[:,:,np.newaxis] ^ np.arange(o_count,dtype=np.uint64)[np.newaxis,np.newaxis,:])
+    # missing options go last, a stable sort keeps them behind any real option with the same key
+    keys[:,np.arange(o_count)[np.newaxis,:] >= option_counts[:,np.newaxis]] = np.iinfo(np.uint64).max
+    return np.argsort(keys,axis=2,kind='stable')
+
+def _letter_tables(orders):
+    """Returns one `str.translate` table per question which maps shown letters to those of the options they show."""
+    tables = []
+    for order in orders:
+        table = {}
+        for (shown_idx,o_idx) in enumerate(order):
+            table[ord('a') + shown_idx] = ord('a') + o_idx
+            table[ord('A') + shown_idx] = ord('A') + o_idx
+        tables.append(table)
+    return tuple(tables)
+
+class PermutationCache:
+    """Bounded LRU mapping of seeds and option counts to letter translation tables."""
+
+    def __init__(self,maxsize=4096):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _remember(self,key,tables):
+        with self._lock:
+            self._entries[key] = tables
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def letter_tables(self,seed,option_counts):
+        key = (seed,option_counts)
+        with self._lock:
+            tables = self._entries.get(key)
+            if tables is not None:
+                self._entries.move_to_end(key)
+                return tables
+        tables = _letter_tables(option_order(seed,q_idx,option_count) for (q_idx,option_count) in enumerate(option_counts))
+        self._remember(key,tables)
+        return tables
+
+    def precompute(self,seeds,option_counts):
+        """Fills the cache for a whole roster at once. Requires numpy."""
+        seeds = list(seeds)
+        table = permutation_table(seeds,option_counts)
+        for (seed,orders) in zip(seeds,table.tolist()):
+            self._remember((seed,option_counts),_letter_tables(order[:option_count] for (order,option_count) in zip(orders,option_counts)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_permutations = PermutationCache()
+
+def letter_tables(seed,option_counts):
+    """Returns the cached `str.translate` tables for `seed`, one per question."""
+    return _permutations.letter_tables(seed,option_counts)
+
+def precompute(seeds,option_counts):
+    """Computes the tables for all `seeds` in one go, e.g. for the roster of a class. Requires numpy."""
+    _permutations.precompute(seeds,option_counts)
+
+def unshuffle(qas,tables):
+    """Maps the letters in `(question_number, letters)` pairs, which refer to the options in the
+    order shown, back to the letters of those options in the question bank."""
+    for (q_number,letters) in qas:
+        if 0 < q_number <= len(tables):
+            letters = letters.translate(tables[q_number - 1])
+        yield (q_number,letters)
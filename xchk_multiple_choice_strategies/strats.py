@@ -1,16 +1,86 @@
+import html
 import os
-from antlr4 import *
+import threading
+from collections import OrderedDict
+from itertools import islice
 from xchk_core.strats import CheckingPredicate, Strategy, OutcomeComponent, OutcomeAnalysis, StratInstructions
 
-from .MultipleChoiceLexer import MultipleChoiceLexer
-from .MultipleChoiceParser import MultipleChoiceParser
-from .MultipleChoiceChecker import MultipleChoiceChecker
+from .model import question_bank
+from .registry import get_registry
+from .shuffle import letter_tables, option_order, precompute, unshuffle
+from .parsing import NOT_ASCII, TOO_LARGE, cached_parse, load_submission, parse_content, qa_positions
+from .scanner import ScanRejected, iter_scan
+from .instrumentation import NULL_TIMER, get_item_collector, start_timer
+from .asyncchecks import check_async
+from .resultcache import get_result_cache
+
+DEFAULT_MAX_ERRORS = 20
+
+def max_errors():
+    """Returns the `XCHK_MC_MAX_ERRORS` setting, the number of errors shown for a submission, if Django is configured."""
+    from django.conf import settings
+    if settings.configured:
+        return getattr(settings,'XCHK_MC_MAX_ERRORS',DEFAULT_MAX_ERRORS)
+    return DEFAULT_MAX_ERRORS
+
+_REJECTION_MESSAGES = {TOO_LARGE: 'Je inzending is te groot om na te kijken.',
+                       NOT_ASCII: 'Je inzending bevat tekens die niet in het formaat voor meerkeuzevragen passen.'}
 
 class MultipleChoiceAnswerCheck(CheckingPredicate):
 
-    def __init__(self,filename,mc_data):
+    # pages kept by render(), e.g. the unshuffled one and those of the students currently working
+    render_cache_size = 32
+
+    def __init__(self,filename,mc_data=None,exercise_id=None,shuffle_seed=None):
+        """Takes either the `mc_data` of the exercise or the id under which it is
+        stored in the answer key registry, in which case it is looked up when needed.
+
+        `shuffle_seed` is an optional function which returns the seed with which the
+        options were shuffled for a submission, e.g. the student's id, or `None`.
+        Letters are then read as referring to the options in the order `render(seed)` shows."""
+        if (mc_data is None) == (exercise_id is None):
+            raise ValueError('either mc_data or exercise_id is required')
         self.filename = filename
-        self.mc_data = mc_data
+        self.exercise_id = exercise_id
+        self.shuffle_seed = shuffle_seed
+        self._mc_data = None
+        if mc_data is not None:
+            self._mc_data = question_bank(mc_data)
+            # reject malformed data here rather than at the first submission
+            self._mc_data.answer_key()
+        # the bank the rendered HTML belongs to and the HTML per seed, least recently used first
+        self._rendered = (None,OrderedDict())
+        # pages may be rendered for several requests at once
+        self._render_lock = threading.Lock()
+
+    def __getstate__(self):
+        # rendered pages are not worth sending along with every check
+        state = self.__dict__.copy()
+        del state['_rendered']
+        del state['_render_lock']
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._rendered = (None,OrderedDict())
+        self._render_lock = threading.Lock()
+
+    @property
+    def mc_data(self):
+        if self.exercise_id is not None:
+            return get_registry().get(self.exercise_id)
+        return self._mc_data
+
+    @mc_data.setter
+    def mc_data(self,mc_data):
+        bank = question_bank(mc_data)
+        bank.answer_key()
+        self.exercise_id = None
+        self._mc_data = bank
+
+    @property
+    def answer_key(self):
+        return self.mc_data.answer_key()
 
     def _entry(self,exercise_name):
         return self.filename or exercise_name
@@ -24,10 +94,36 @@ class MultipleChoiceAnswerCheck(CheckingPredicate):
     def negative_instructions(self,exercise_name,init_check_number):
         return [f'Je hebt niet alle correcte antwoorden per vraag aangeduid.']
 
-    def render(self):
-        def _answers_as_lis(q_tuple):
-            return ''.join([f'<li>{a[0]}</li>' for a in q[1:-1]])
-        questions_as_lis = ''.join([f"<li>{q[0]}<ul>{_answers_as_lis(q)}</ul></li>" for q in self.mc_data])
+    def render(self,seed=None):
+        """Returns the questions and their options as HTML.
+
+        With a `seed`, the options of each question are shown in the order `shuffle.option_order`
+        gives for it. The HTML for the `render_cache_size` most recently used seeds is kept."""
+        bank = self.mc_data
+        with self._render_lock:
+            (rendered_bank,rendered) = self._rendered
+            if rendered_bank is not bank:
+                rendered = OrderedDict()
+                self._rendered = (bank,rendered)
+            html_text = rendered.get(seed)
+            if html_text is not None:
+                rendered.move_to_end(seed)
+                return html_text
+        html_text = self._render(bank,seed)
+        with self._render_lock:
+            rendered[seed] = html_text
+            while len(rendered) > self.render_cache_size:
+                rendered.popitem(last=False)
+        return html_text
+
+    @staticmethod
+    def _render(bank,seed):
+        def _answers_as_lis(q_idx,question):
+            options = question.options
+            if seed is not None:
+                options = [options[o_idx] for o_idx in option_order(seed,q_idx,len(options))]
+            return ''.join([f'<li>{html.escape(option.text)}</li>' for option in options])
+        questions_as_lis = ''.join([f"<li>{html.escape(question.text)}<ul>{_answers_as_lis(q_idx,question)}</ul></li>" for (q_idx,question) in enumerate(bank)])
         return f'<ul class=multiple-choice>{questions_as_lis}</ul>'
 
     def check_submission(self,submission,student_path,desired_outcome,init_check_number,ancestor_has_alternatives,parent_is_negation=False,open=open):
@@ -35,23 +131,124 @@ class MultipleChoiceAnswerCheck(CheckingPredicate):
         # moet bij elke vraag controleren of de antwoorden (na lower case) voorkomen in de reeks antwoorden
         # hier moeten we ja/nee zeggen en de relatie tot gewenste uitkomst geven
         # is niet duidelijk bij gelijk welke exception, dus beter niveau hoger afhandelen?
-        input_stream = FileStream(os.path.join(student_path,self._entry(submission.content_uid)))
-        lexer = MultipleChoiceLexer(input_stream)
-        stream = CommonTokenStream(lexer)
-        parser = MultipleChoiceParser(stream)
-        tree = parser.multiplechoice()
-        checker = MultipleChoiceChecker(self.mc_data)
-        walker = ParseTreeWalker()
-        walker.walk(checker,tree)
-        overall_outcome = len(checker.error_list) == 0
+        timer = start_timer()
+        content = load_submission(os.path.join(student_path,self._entry(submission.content_uid)))
+        timer.lap('read')
+        return self.check_content(content,desired_outcome,init_check_number,ancestor_has_alternatives,timer,seed=self._seed(submission))
+
+    async def check_submission_async(self,submission,student_path,desired_outcome,init_check_number,ancestor_has_alternatives,parent_is_negation=False):
+        """Counterpart of `check_submission` for use on an event loop, see `asyncchecks.check_async`."""
+        return await check_async(self,os.path.join(student_path,self._entry(submission.content_uid)),desired_outcome,init_check_number,ancestor_has_alternatives,seed=self._seed(submission))
+
+    def _seed(self,submission):
+        return None if self.shuffle_seed is None else self.shuffle_seed(submission)
+
+    def check_content(self,content,desired_outcome,init_check_number,ancestor_has_alternatives,timer=NULL_TIMER,seed=None):
+        """Does what `check_submission` does for a submission loaded with `parsing.load_submission`,
+        with its options shown in the order for `seed`."""
+        answer_key = self.answer_key
+        tables = None if seed is None else letter_tables(seed,answer_key.option_counts)
+        results = get_result_cache()
+        check_digest = answer_key.fingerprint if seed is None else f'{answer_key.fingerprint}/{seed!r}'
+        key = results.key('answers',content.digest,check_digest,desired_outcome,init_check_number,ancestor_has_alternatives)
+        analysis = results.get(key)
+        timer.lap('lookup')
+        if analysis is not None:
+            self._collect(content,None,analysis.outcome,answer_key,tables)
+            timer.report('answers',content)
+            return analysis
+        (overall_outcome,parsed) = self._grade(content,answer_key,timer,tables)
+        analysis = self._analysis(overall_outcome,desired_outcome,init_check_number,ancestor_has_alternatives,lambda: self._feedback(content,overall_outcome,answer_key,tables))
+        results.put(key,analysis)
+        self._collect(content,parsed,overall_outcome,answer_key,tables)
+        timer.lap('outcome')
+        timer.report('answers',content,parsed)
+        return analysis
+
+    @staticmethod
+    def _answers(qas,tables):
+        return qas if tables is None else unshuffle(qas,tables)
+
+    def _collect(self,content,parsed,overall_outcome,answer_key,tables=None):
+        """Passes the answers in a well-formed submission to the item collector, if one is set."""
+        collector = get_item_collector()
+        if collector is None:
+            return
+        if parsed is None:
+            parsed = parse_content(content)
+        if parsed.well_formed:
+            collector.record(self.exercise_id,answer_key,list(self._answers(parsed.qas,tables)),overall_outcome)
+
+    def _grade(self,content,answer_key,timer,tables=None):
+        """Returns the outcome for a loaded submission and its `ParseResult`, if it was parsed completely."""
+        parsed = cached_parse(content)
+        if parsed is None and content.rejection is None and get_item_collector() is None:
+            # not parsed by another check yet, so only read as far as needed to decide
+            try:
+                overall_outcome = answer_key.passes(self._answers(iter_scan(content.data),tables))
+                timer.lap('grade')
+                return (overall_outcome,None)
+            except ScanRejected:
+                pass
+        if parsed is None:
+            parsed = parse_content(content,timer)
+        overall_outcome = parsed.rejection is None and answer_key.passes(self._answers(parsed.qas,tables))
+        timer.lap('grade')
+        return (overall_outcome,parsed)
+
+    def _feedback(self,content,overall_outcome,answer_key,tables):
+        """Returns HTML which lists the errors in a submission, at most `max_errors()` of them."""
+        if overall_outcome:
+            return '<p>Je hebt alle vragen correct beantwoord.</p>'
+        if content.rejection is not None:
+            return f'<p>{_REJECTION_MESSAGES[content.rejection]}</p>'
+        parsed = parse_content(content)
+        limit = max_errors()
+        records = list(islice(answer_key.iter_error_records(self._answers(parsed.qas,tables),qa_positions(content,parsed)),limit + 1))
+        items = []
+        for record in records[:limit]:
+            message = answer_key.message(record)
+            if record.line is not None:
+                message = f'Regel {record.line}, kolom {record.column + 1}: {message}'
+            items.append(f'<li>{html.escape(message)}</li>')
+        if len(records) > limit:
+            items.append('<li>Er zijn nog meer fouten, die niet getoond worden.</li>')
+        return f"<ul class=multiple-choice-errors>{''.join(items)}</ul>"
+
+    def _analysis(self,overall_outcome,desired_outcome,init_check_number,ancestor_has_alternatives,feedback):
+        """Builds the outcome, calling `feedback` for the `rendered_data` only if the outcome is not the desired one."""
         components = [OutcomeComponent(component_number=init_check_number,
                                        outcome=overall_outcome,
                                        desired_outcome=desired_outcome,
-                                       rendered_data="meer doen met errorlist" if overall_outcome != desired_outcome else None,
+                                       rendered_data=feedback() if overall_outcome != desired_outcome else None,
                                        acceptable_to_ancestor = overall_outcome == desired_outcome or ancestor_has_alternatives)]
         return OutcomeAnalysis(outcome=overall_outcome,
                                outcomes_components=components)
 
+    def grade_many(self,paths,desired_outcome=True,init_check_number=1,ancestor_has_alternatives=False,seeds=None):
+        """Grades the submissions at `paths` at once, with their options shown in the order
+        for the corresponding element of `seeds`, if given.
+
+        Returns one `OutcomeAnalysis` per path, equal to what `check_submission` returns for it. Requires numpy."""
+        from .batch import passing
+        contents = [load_submission(path) for path in paths]
+        parsed = [parse_content(content) for content in contents]
+        answer_key = self.answer_key
+        if seeds is None:
+            seeds = [None] * len(paths)
+        else:
+            precompute({seed for seed in seeds if seed is not None},answer_key.option_counts)
+        tables_per_submission = [None if seed is None else letter_tables(seed,answer_key.option_counts) for seed in seeds]
+        qas_per_submission = [list(self._answers(p.qas,tables)) for (p,tables) in zip(parsed,tables_per_submission)]
+        outcomes = [bool(outcome) and p.rejection is None for (outcome,p) in zip(passing(answer_key,qas_per_submission),parsed)]
+        collector = get_item_collector()
+        if collector is not None:
+            for (outcome,p,qas) in zip(outcomes,parsed,qas_per_submission):
+                if p.well_formed:
+                    collector.record(self.exercise_id,answer_key,qas,outcome)
+        return [self._analysis(outcome,desired_outcome,init_check_number,ancestor_has_alternatives,lambda: self._feedback(content,outcome,answer_key,tables))
+                for (outcome,content,tables) in zip(outcomes,contents,tables_per_submission)]
+
 class MultipleChoiceFormatCheck(CheckingPredicate):
 
     def __init__(self,filename=None):
@@ -73,19 +270,37 @@ class MultipleChoiceFormatCheck(CheckingPredicate):
 
     def check_submission(self,submission,student_path,desired_outcome,init_check_number,ancestor_has_alternatives,parent_is_negation=False,open=open):
         # with open(os.path.join(student_path,self._entry(submission.content_uid))) as fhs:
-        input_stream = FileStream(os.path.join(student_path,self._entry(submission.content_uid)))
-        lexer = MultipleChoiceLexer(input_stream)
-        token_stream = CommonTokenStream(lexer)
-        parser = MultipleChoiceParser(token_stream)
-        tree = parser.multiplechoice()
-        overall_outcome = parser.getNumberOfSyntaxErrors() == 0
+        timer = start_timer()
+        content = load_submission(os.path.join(student_path,self._entry(submission.content_uid)))
+        timer.lap('read')
+        return self.check_content(content,desired_outcome,init_check_number,ancestor_has_alternatives,timer)
+
+    async def check_submission_async(self,submission,student_path,desired_outcome,init_check_number,ancestor_has_alternatives,parent_is_negation=False):
+        """Counterpart of `check_submission` for use on an event loop, see `asyncchecks.check_async`."""
+        return await check_async(self,os.path.join(student_path,self._entry(submission.content_uid)),desired_outcome,init_check_number,ancestor_has_alternatives)
+
+    def check_content(self,content,desired_outcome,init_check_number,ancestor_has_alternatives,timer=NULL_TIMER):
+        """Does what `check_submission` does for a submission loaded with `parsing.load_submission`."""
+        results = get_result_cache()
+        key = results.key('format',content.digest,'',desired_outcome,init_check_number,ancestor_has_alternatives)
+        analysis = results.get(key)
+        timer.lap('lookup')
+        if analysis is not None:
+            timer.report('format',content)
+            return analysis
+        parsed = parse_content(content,timer)
+        overall_outcome = parsed.well_formed
         components = [OutcomeComponent(component_number=init_check_number,
                                        outcome=overall_outcome,
                                        desired_outcome=desired_outcome,
                                        rendered_data="<p>Het formaat voor meerkeuzevragen is als volgt:</p>" if overall_outcome != desired_outcome else None,
                                        acceptable_to_ancestor = overall_outcome == desired_outcome or ancestor_has_alternatives)]
-        return OutcomeAnalysis(outcome=overall_outcome,
-                               outcomes_components=components)
+        analysis = OutcomeAnalysis(outcome=overall_outcome,
+                                   outcomes_components=components)
+        results.put(key,analysis)
+        timer.lap('outcome')
+        timer.report('format',content,parsed)
+        return analysis
 
 # if desired, define strategies by subclassing Strategy
 # override __init__ so that refusing_check and accepting_check are hardwired
@@ -1,12 +1,59 @@
+import asyncio
+import copy
+import io
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from operator import attrgetter
 from unittest.mock import MagicMock, patch
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, override_settings
 from xchk_multiple_choice_strategies.strats import MultipleChoiceFormatCheck, MultipleChoiceAnswerCheck
+from xchk_multiple_choice_strategies.scanner import scan, iter_scan, qa_positions, ScanRejected, QUESTION_OUT_OF_RANGE
+from xchk_multiple_choice_strategies import parsing
+from xchk_multiple_choice_strategies.parsing import parse_with_antlr, grading_run, get_parse_cache, set_parse_cache
+from xchk_multiple_choice_strategies.answerkey import AnswerKey, ErrorRecord, INCORRECT, MISSING, NUMBERING
+from xchk_multiple_choice_strategies.model import Option, Question, QuestionBank, question_bank
+from xchk_multiple_choice_strategies.bulk import regrade
+from xchk_multiple_choice_strategies import asyncchecks
+from xchk_multiple_choice_strategies.shuffle import option_order, permutation_table
+from xchk_multiple_choice_strategies.registry import AnswerKeyRegistry, build_registry, set_registry
+from xchk_multiple_choice_strategies.instrumentation import NULL_TIMER, HistogramSink, set_item_collector, set_metrics_sink
+from xchk_multiple_choice_strategies.itemanalysis import ItemAnalysis
+from xchk_multiple_choice_strategies.resultcache import ResultCache, DjangoCacheBackend, get_result_cache
+
+EXAMPLE_MC_DATA = [("Welke kleuren zitten in de Belgische vlag?",
+                    ("Zwart",True,"Kijk nog eens naar de linkerbaan."),
+                    ("Blauw",False,"Dat is de Franse vlag."),
+                    ("Geel",True,None),
+                    ("Rood",True,"Kijk nog eens naar de rechterbaan.")),
+                   ("Is 7 een priemgetal?",
+                    ("Ja",True,None),
+                    ("Nee",False,"Welke delers heeft 7?"))]
 from xchk_core.strats import OutcomeAnalysis, OutcomeComponent
 from xchk_core.models import SubmissionV2
 
+def _check(chk,data,desired_outcome=True,submission=None):
+    """Runs `chk` on a submission whose file holds the bytes `data`."""
+    # will need to patch open, just providing won't work here because of how antlr reads filestream
+    with patch('builtins.open') as mock_open:
+        # https://github.com/antlr/antlr4/blob/master/runtime/Python3/src/antlr4/FileStream.py
+        # need to mock read() method
+        mock_open.return_value.__enter__.return_value.read.return_value = data
+        return chk.check_submission(submission=SubmissionV2() if submission is None else submission,student_path='/student',desired_outcome=desired_outcome,init_check_number=1,ancestor_has_alternatives=False,parent_is_negation=False)
+
 class MultipleChoiceFormatCheckTest(TestCase):
 
+    rejected = OutcomeAnalysis(outcome=False,outcomes_components=[OutcomeComponent(component_number=1,outcome=False,desired_outcome=True,rendered_data='<p>Het formaat voor meerkeuzevragen is als volgt:</p>',acceptable_to_ancestor=False)])
+
     def test_valid_input(self):
         # will need to patch open, just providing won't work here because of how antlr reads filestream
         chk = MultipleChoiceFormatCheck(filename='myfile.txt')
@@ -28,6 +75,16 @@ class MultipleChoiceFormatCheckTest(TestCase):
             expected = OutcomeAnalysis(outcome=False,outcomes_components=[OutcomeComponent(component_number=1,outcome=False,desired_outcome=True,rendered_data='<p>Het formaat voor meerkeuzevragen is als volgt:</p>',acceptable_to_ancestor=False)])
             self.assertEqual(outcome,expected)
 
+    def test_huge_question_number(self):
+        self.assertTrue(_check(MultipleChoiceFormatCheck(filename='myfile.txt'),b'1 a 2' + b'0' * 5000 + b' b').outcome)
+
+    def test_non_ascii_input(self):
+        self.assertEqual(_check(MultipleChoiceFormatCheck(filename='myfile.txt'),'1 A 2 B // één'.encode('utf-8')),self.rejected)
+
+    @override_settings(XCHK_MC_MAX_SUBMISSION_SIZE=8)
+    def test_oversized_input(self):
+        self.assertEqual(_check(MultipleChoiceFormatCheck(filename='myfile.txt'),b'1 A 2 B 3 C'),self.rejected)
+
 class MultipleChoiceAnswerCheckTest(TestCase):
 
     def test_valid_answers(self):
@@ -51,5 +108,839 @@ class MultipleChoiceAnswerCheckTest(TestCase):
             expected = OutcomeAnalysis(outcome=True,outcomes_components=[OutcomeComponent(component_number=1,outcome=True,desired_outcome=True,rendered_data=None,acceptable_to_ancestor=True)])
             self.assertEqual(outcome,expected)
 
+    def test_early_exit_skips_antlr(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        get_parse_cache().clear()
+        get_result_cache().clear()
+        with patch('xchk_multiple_choice_strategies.parsing.parse_with_antlr') as mock_antlr:
+            # the wrong answer to question 1 decides the outcome before the scanner reaches the garbage
+            self.assertFalse(_check(chk,b'1 B 2 A !?!',desired_outcome=False).outcome)
+            mock_antlr.assert_not_called()
+            # a correct prefix is not enough
+            mock_antlr.return_value = parsing.ParseResult(syntax_errors=0,qas=[(1,'ACD'),(2,'A')])
+            _check(chk,b'1 ACD 2 A !?!',desired_outcome=False)
+            mock_antlr.assert_called_once()
+
+    def test_reuses_parse_of_other_check(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        get_parse_cache().clear()
+        get_result_cache().clear()
+        _check(MultipleChoiceFormatCheck(filename='myfile.txt'),b'1 ACD 2 A')
+        with patch('xchk_multiple_choice_strategies.strats.iter_scan') as mock_scan:
+            self.assertTrue(_check(chk,b'1 ACD 2 A').outcome)
+            mock_scan.assert_not_called()
+
+    def test_rejected_input(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        outcome = _check(chk,b'1 ACD 2 A \xff',desired_outcome=False)
+        self.assertFalse(outcome.outcome)
+        self.assertEqual(outcome.outcomes_components[0].rendered_data,None)
+        outcome = _check(chk,b'1 ACD 2 A \xff')
+        self.assertIn('tekens',outcome.outcomes_components[0].rendered_data)
+
+    def test_errors_in_feedback(self):
+        get_result_cache().clear()
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        self.assertEqual(_check(chk,b'1 ACD\n  2 B').outcomes_components[0].rendered_data,
+                         '<ul class=multiple-choice-errors><li>Regel 2, kolom 3: Vraag 2: Welke delers heeft 7?</li></ul>')
+        # found by the ANTLR parser
+        self.assertEqual(_check(chk,b'1 ACD\n2 ? B').outcomes_components[0].rendered_data,
+                         '<ul class=multiple-choice-errors><li>Regel 2, kolom 1: Vraag 2: Welke delers heeft 7?</li></ul>')
+
+    @override_settings(XCHK_MC_MAX_ERRORS=2)
+    def test_errors_are_capped(self):
+        get_result_cache().clear()
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        self.assertEqual(_check(chk,b'1 B 2 B').outcomes_components[0].rendered_data,
+                         '<ul class=multiple-choice-errors><li>Regel 1, kolom 1: Vraag 1: Kijk nog eens naar de linkerbaan.</li>'
+                         '<li>Regel 1, kolom 1: Vraag 1: Kijk nog eens naar de rechterbaan.</li>'
+                         '<li>Er zijn nog meer fouten, die niet getoond worden.</li></ul>')
+
+class AnswerKeyTest(TestCase):
+
+    def setUp(self):
+        self.key = AnswerKey(EXAMPLE_MC_DATA)
+
+    def test_compiled_masks(self):
+        self.assertEqual(self.key.option_counts,(4,2))
+        self.assertEqual(self.key.correct,(0b1101,0b01))
+        self.assertEqual(self.key.hinted,(0b1011,0b10))
+        self.assertEqual(self.key.hints[1],(None,"Welke delers heeft 7?"))
+
+    def test_correct_answers(self):
+        self.assertEqual(self.key.grade([(1,'ACD'),(2,'a')]),[])
+        # options without a hint are not held against the student
+        self.assertEqual(self.key.grade([(1,'AD'),(2,'A')]),[])
+
+    def test_missing_and_incorrect_answers(self):
+        self.assertEqual(self.key.grade([(1,'BC'),(2,'AB')]),
+                         ['Vraag 1: Kijk nog eens naar de linkerbaan.',
+                          'Vraag 1: Kijk nog eens naar de rechterbaan.',
+                          'Vraag 1: Dat is de Franse vlag.',
+                          'Vraag 2: Welke delers heeft 7?'])
+
+    def test_numbering(self):
+        self.assertEqual(self.key.grade([(2,'A'),(3,'A')]),
+                         ['Vraag 1 werd verwacht op de plaats waar 2 voorkomt.',
+                          'Vraag 3 is geen geldige index. Er zijn 2 vragen en deze worden geteld vanaf 1.'])
+
+    def test_letter_beyond_options(self):
+        self.assertEqual(self.key.grade([(1,'ACD'),(2,'AZ')]),['Vraag 2: er is geen antwoord z.'])
+
+    def test_invalid_mc_data(self):
+        for mc_data in [[("Vraag zonder opties",)],
+                        [("Vraag",("Ja",True))],
+                        [("Vraag",) + tuple((str(i),False,None) for i in range(27))]]:
+            with self.assertRaises(ValueError):
+                AnswerKey(mc_data)
+            with self.assertRaises(ValueError):
+                MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=mc_data)
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.key.correct = ()
+
+    def test_passes_agrees_with_grade(self):
+        rng = random.Random(5)
+        for _ in range(500):
+            qas = [(rng.choice([1,1,2,2,3]),''.join(rng.sample('abcdeABCD',rng.randint(0,3)))) for _ in range(rng.randint(0,3))]
+            self.assertEqual(self.key.passes(qas),self.key.grade(qas) == [],qas)
+
+    def test_passes_stops_at_first_error(self):
+        consumed = []
+        def qas():
+            for qa in [(1,'ACD'),(2,'B'),(3,'A')]:
+                consumed.append(qa)
+                yield qa
+        self.assertFalse(self.key.passes(qas()))
+        self.assertEqual(consumed,[(1,'ACD'),(2,'B')])
+
+    def test_error_records(self):
+        records = list(self.key.iter_error_records([(2,'A'),(1,'B')],[(1,0),(3,4)]))
+        self.assertEqual(records,[ErrorRecord(NUMBERING,2,line=1,column=0,expected=1),
+                                  ErrorRecord(NUMBERING,1,line=3,column=4,expected=3),
+                                  ErrorRecord(MISSING,1,0,3,4),
+                                  ErrorRecord(MISSING,1,3,3,4),
+                                  ErrorRecord(INCORRECT,1,1,3,4)])
+        self.assertEqual([self.key.message(record) for record in records],self.key.grade([(2,'A'),(1,'B')]))
+
+    def test_iter_errors_is_lazy(self):
+        errors = self.key.iter_errors([(1,'B'),(2,'A')])
+        self.assertEqual(next(errors),'Vraag 1: Kijk nog eens naar de linkerbaan.')
+
+class QuestionBankTest(TestCase):
+
+    def test_legacy_tuples_are_converted(self):
+        bank = question_bank(EXAMPLE_MC_DATA)
+        self.assertEqual(len(bank),2)
+        self.assertEqual(bank[1],Question("Is 7 een priemgetal?",[Option("Ja",True),Option("Nee",False,"Welke delers heeft 7?")]))
+        self.assertIs(bank[0].options[2].hint,None)
+
+    def test_identical_banks_are_shared(self):
+        same_data = json.loads(json.dumps(EXAMPLE_MC_DATA))
+        bank = question_bank(EXAMPLE_MC_DATA)
+        self.assertIs(question_bank(same_data),bank)
+        self.assertIs(question_bank(bank),bank)
+        self.assertIs(MultipleChoiceAnswerCheck(filename=None,mc_data=same_data).mc_data,bank)
+
+    def test_answer_key_is_shared(self):
+        first = MultipleChoiceAnswerCheck(filename=None,mc_data=EXAMPLE_MC_DATA)
+        second = MultipleChoiceAnswerCheck(filename=None,mc_data=list(EXAMPLE_MC_DATA))
+        self.assertIs(first.answer_key,second.answer_key)
+
+    def test_strings_are_interned(self):
+        text = ''.join(['Ge','el'])
+        bank = question_bank([("Vraag",(text,True,None))])
+        self.assertIs(bank[0].options[0].text,sys.intern('Geel'))
+
+    def test_accepts_model(self):
+        bank = question_bank([Question("Is 7 een priemgetal?",[Option("Ja",True),Option("Nee",False,"Welke delers heeft 7?")])])
+        self.assertEqual(AnswerKey(bank).fingerprint,AnswerKey(EXAMPLE_MC_DATA[1:]).fingerprint)
+
+    def test_invalid_mc_data(self):
+        for mc_data in [[("Vraag zonder opties",)],
+                        [("Vraag",("Ja",True))],
+                        ["Vraag"]]:
+            with self.assertRaises(ValueError):
+                question_bank(mc_data)
+
+class RenderTest(TestCase):
+
+    def test_all_options_escaped(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=[("Is 1 < 2?",("Ja",True,None),("Nee & nooit",False,None))])
+        self.assertEqual(chk.render(),'<ul class=multiple-choice><li>Is 1 &lt; 2?<ul><li>Ja</li><li>Nee &amp; nooit</li></ul></li></ul>')
+
+    def test_cached_until_mc_data_changes(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        rendered = chk.render()
+        self.assertIs(chk.render(),rendered)
+        chk.mc_data = EXAMPLE_MC_DATA[1:]
+        self.assertNotIn('Belgische',chk.render())
+        self.assertIsInstance(chk.mc_data,QuestionBank)
+
+    def test_shuffled(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        # pinned, so the order does not change for students who already saw it
+        self.assertEqual([option_order(42,q_idx,4) for q_idx in range(3)],[[2,0,1,3],[1,0,3,2],[3,2,0,1]])
+        self.assertEqual(option_order('r0123456',0,4),[0,2,3,1])
+        self.assertTrue(chk.render(seed=42).startswith('<ul class=multiple-choice><li>Welke kleuren zitten in de Belgische vlag?<ul><li>Geel</li><li>Zwart</li><li>Blauw</li><li>Rood</li></ul>'))
+        self.assertIs(chk.render(seed=42),chk.render(seed=42))
+        for seed in range(20):
+            self.assertEqual(sorted(option_order(seed,0,5)),list(range(5)))
+
+    def test_cache_is_bounded(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        unshuffled = chk.render()
+        for seed in range(2 * chk.render_cache_size):
+            chk.render(seed=seed)
+            # recently used pages stay
+            self.assertIs(chk.render(),unshuffled)
+        self.assertEqual(len(chk._rendered[1]),chk.render_cache_size)
+
+    def test_concurrent_renders(self):
+        class SlowLookups(OrderedDict):
+            # lets other threads evict a page between looking it up and marking it as used
+            def get(self,key,default=None):
+                value = super().get(key,default)
+                time.sleep(0.0001)
+                return value
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        chk.render_cache_size = 2
+        chk._rendered = (chk.mc_data,SlowLookups())
+        seeds = [idx % 3 for idx in range(2000)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            pages = list(executor.map(lambda seed: chk.render(seed=seed),seeds))
+        self.assertEqual(pages,[MultipleChoiceAnswerCheck._render(chk.mc_data,seed) for seed in seeds])
+        self.assertLessEqual(len(chk._rendered[1]),chk.render_cache_size)
+
+class ShuffledGradingTest(TestCase):
+
+    def setUp(self):
+        get_result_cache().clear()
+
+    @staticmethod
+    def _passes(chk,data,seed):
+        submission = SubmissionV2()
+        submission.seed = seed
+        return _check(chk,data,submission=submission).outcome
+
+    def test_permutation_table_matches_option_order(self):
+        rng = random.Random(6)
+        seeds = [rng.getrandbits(64) for _ in range(200)] + ['r0123456',0]
+        option_counts = (4,2,5,1)
+        table = permutation_table(seeds,option_counts)
+        for (s_idx,seed) in enumerate(seeds):
+            for (q_idx,option_count) in enumerate(option_counts):
+                self.assertEqual(table[s_idx,q_idx,:option_count].tolist(),option_order(seed,q_idx,option_count))
+
+    def test_pickled_without_pages(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA,shuffle_seed=attrgetter('seed'))
+        for seed in range(10):
+            chk.render(seed=seed)
+        unpickled = pickle.loads(pickle.dumps(chk))
+        submission = SubmissionV2()
+        submission.seed = 7
+        self.assertEqual(unpickled._seed(submission),7)
+        self.assertEqual(len(unpickled._rendered[1]),0)
+        self.assertEqual(unpickled.render(seed=3),chk.render(seed=3))
+        self.assertIs(unpickled.answer_key,chk.answer_key)
+
+    def test_copies_keep_seed_function(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA,shuffle_seed=lambda submission: submission.seed)
+        for copied in [copy.copy(chk),copy.deepcopy(chk)]:
+            self.assertIs(copied.shuffle_seed,chk.shuffle_seed)
+            self.assertTrue(self._passes(copied,b'1 ABD 2 B',42))
+
+    def test_letters_refer_to_shown_order(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA,shuffle_seed=lambda submission: submission.seed)
+        # seed 42 shows Geel, Zwart, Blauw, Rood and Nee, Ja
+        self.assertIn('<li>Nee</li><li>Ja</li>',chk.render(seed=42))
+        self.assertTrue(self._passes(chk,b'1 ABD 2 B',42))
+        self.assertFalse(self._passes(chk,b'1 ACD 2 A',42))
+        self.assertTrue(self._passes(chk,b'1 ACD 2 A',None))
+
+    def test_grade_many_with_seeds(self):
+        chk = MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=EXAMPLE_MC_DATA,shuffle_seed=lambda submission: submission.seed)
+        rng = random.Random(7)
+        with tempfile.TemporaryDirectory() as root:
+            (paths,seeds,expected) = ([],[],[])
+            for idx in range(100):
+                data = ' '.join(f'{q_number} {"".join(rng.sample("abcd",rng.randint(1,3)))}' for q_number in (1,2)).encode('ascii')
+                seed = rng.choice([None,f'student{idx}'])
+                paths.append(os.path.join(root,f'{idx}.txt'))
+                with open(paths[-1],'wb') as fh:
+                    fh.write(data)
+                seeds.append(seed)
+                expected.append(self._passes(chk,data,seed))
+            self.assertEqual([analysis.outcome for analysis in chk.grade_many(paths,seeds=seeds)],expected)
+            self.assertTrue(any(expected))
+
+class BatchGradingTest(TestCase):
+
+    def test_same_outcomes_as_check_submission(self):
+        rng = random.Random(4)
+        chk = MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=EXAMPLE_MC_DATA)
+        with tempfile.TemporaryDirectory() as root:
+            student_paths = []
+            for idx in range(200):
+                student_path = os.path.join(root,str(idx))
+                os.mkdir(student_path)
+                qas = [(q_number,''.join(rng.sample('abcdABCDe',rng.randint(0,3)))) for q_number in (1,2)]
+                if rng.random() < 0.1:
+                    qas.reverse()
+                with open(os.path.join(student_path,'antwoorden.txt'),'w') as fh:
+                    fh.write(' '.join(f'{q_number} {letters}' for (q_number,letters) in qas))
+                student_paths.append(student_path)
+            for desired_outcome in (True,False):
+                expected = [chk.check_submission(submission=SubmissionV2(),student_path=student_path,desired_outcome=desired_outcome,init_check_number=3,ancestor_has_alternatives=False) for student_path in student_paths]
+                actual = chk.grade_many([os.path.join(student_path,'antwoorden.txt') for student_path in student_paths],desired_outcome=desired_outcome,init_check_number=3)
+                self.assertEqual(actual,expected)
+            self.assertTrue(any(analysis.outcome for analysis in expected))
+            self.assertFalse(all(analysis.outcome for analysis in expected))
+
+class ItemAnalysisTest(TestCase):
+
+    submissions = [b'1 ACD 2 A', b'1 AB 2 B', b'1 ACD 2 A', b'2 A 1 C', b'geen antwoorden']
+
+    def setUp(self):
+        get_result_cache().clear()
+        self.collector = ItemAnalysis()
+        set_item_collector(self.collector)
+
+    def tearDown(self):
+        set_item_collector(None)
+
+    def test_counts(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        for data in self.submissions:
+            _check(chk,data)
+        ((key,counts),) = self.collector.snapshot().items()
+        self.assertEqual(key,(None,AnswerKey(EXAMPLE_MC_DATA).fingerprint))
+        # the malformed submission is left out, the repeated one (a result cache hit) is not
+        self.assertEqual((counts.submissions,counts.passed),(4,2))
+        self.assertEqual(counts.chosen.tolist(),[[3,1,3,2],[3,1,0,0]])
+        # answers are judged on their own, so the swapped answer to question 2 is correct
+        self.assertEqual(counts.correct.tolist(),[2,3])
+        self.assertEqual(counts.incorrect.tolist(),[2,1])
+
+    def test_merge_and_export(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        for data in self.submissions:
+            _check(chk,data)
+        merged = ItemAnalysis()
+        merged.merge(self.collector.snapshot())
+        merged.merge(self.collector.snapshot())
+        (exercise,) = merged.as_dict()['exercises']
+        self.assertEqual(exercise['submissions'],8)
+        self.assertEqual(exercise['questions'][1],{'question': 2,'correct': 6,'incorrect': 2,'chosen': {'a': 6,'b': 2}})
+        out = io.StringIO()
+        merged.dump_csv(out)
+        rows = out.getvalue().splitlines()
+        self.assertEqual(len(rows),1 + 4 + 2)
+        self.assertTrue(rows[1].endswith(',1,a,6,4,4,8'))
+        self.assertEqual(json.loads(json.dumps(merged.as_dict())),merged.as_dict())
+
+    def test_grade_many_counts_the_same(self):
+        chk = MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=EXAMPLE_MC_DATA)
+        for data in self.submissions:
+            _check(chk,data)
+        expected = self.collector.as_dict()
+        self.collector.reset()
+        with tempfile.TemporaryDirectory() as root:
+            paths = []
+            for (idx,data) in enumerate(self.submissions):
+                paths.append(os.path.join(root,f'{idx}.txt'))
+                with open(paths[-1],'wb') as fh:
+                    fh.write(data)
+            chk.grade_many(paths)
+        self.assertEqual(self.collector.as_dict(),expected)
+
+class AsyncCheckTest(TestCase):
+
+    submissions = {'jan': b'1 ACD 2 A', 'piet': b'1 AB 2 A', 'mieke': b'geen antwoorden'}
+
+    def setUp(self):
+        get_result_cache().clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        for (student,data) in self.submissions.items():
+            os.mkdir(os.path.join(self.tmp.name,student))
+            with open(os.path.join(self.tmp.name,student,'antwoorden.txt'),'wb') as fh:
+                fh.write(data)
+        self.checks = [MultipleChoiceFormatCheck(filename='antwoorden.txt'),MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=EXAMPLE_MC_DATA)]
+
+    def tearDown(self):
+        asyncchecks.set_executor(None)
+        self.tmp.cleanup()
+
+    def _check_all(self,chk):
+        async def check_all():
+            return await asyncio.gather(*[chk.check_submission_async(submission=SubmissionV2(),student_path=os.path.join(self.tmp.name,student),desired_outcome=True,init_check_number=1,ancestor_has_alternatives=False) for student in self.submissions])
+        return asyncio.run(check_all())
+
+    def test_same_outcomes_as_check_submission(self):
+        for chk in self.checks:
+            expected = [chk.check_submission(submission=SubmissionV2(),student_path=os.path.join(self.tmp.name,student),desired_outcome=True,init_check_number=1,ancestor_has_alternatives=False) for student in self.submissions]
+            get_result_cache().clear()
+            self.assertEqual(self._check_all(chk),expected)
+
+    def test_process_executor(self):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            asyncchecks.set_executor(executor)
+            # the answer check leaves the format to the format check
+            self.assertEqual([analysis.outcome for analysis in self._check_all(self.checks[1])],[True,False,True])
+
+    def test_process_executor_with_shuffled_options(self):
+        # the seed function is not picklable, the seed itself is computed before the check is sent
+        chk = MultipleChoiceAnswerCheck(filename='antwoorden.txt',mc_data=EXAMPLE_MC_DATA,shuffle_seed=lambda submission: 42)
+        expected = [chk.check_submission(submission=SubmissionV2(),student_path=os.path.join(self.tmp.name,student),desired_outcome=True,init_check_number=1,ancestor_has_alternatives=False) for student in self.submissions]
+        get_result_cache().clear()
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            asyncchecks.set_executor(executor)
+            self.assertEqual(self._check_all(chk),expected)
+        self.assertIsNotNone(chk.shuffle_seed)
+
+    def test_concurrent_checks_of_a_file_are_shared(self):
+        chk = self.checks[1]
+        student_path = os.path.join(self.tmp.name,'jan')
+        async def check_five_times():
+            return await asyncio.gather(*[chk.check_submission_async(submission=SubmissionV2(),student_path=student_path,desired_outcome=True,init_check_number=1,ancestor_has_alternatives=False) for _ in range(5)])
+        with patch('xchk_multiple_choice_strategies.asyncchecks.load_submission',wraps=parsing.load_submission) as mock_load:
+            outcomes = asyncio.run(check_five_times())
+            self.assertEqual(mock_load.call_count,1)
+        self.assertTrue(all(analysis == outcomes[0] for analysis in outcomes))
+        # callers may modify what they get back
+        self.assertIsNot(outcomes[0],outcomes[1])
+
+class BulkRegradeTest(TestCase):
+
+    submissions = {'jan': '1 ACD 2 A', 'piet': '1 AB 2 A', 'mieke': 'geen antwoorden'}
+
+    def test_regrade_and_resume(self):
+        with tempfile.TemporaryDirectory() as root:
+            for (student,content) in self.submissions.items():
+                os.makedirs(os.path.join(root,'groep1',student))
+                with open(os.path.join(root,'groep1',student,'antwoorden.txt'),'w') as fh:
+                    fh.write(content)
+            output_path = os.path.join(root,'uitkomsten.jsonl')
+            done = regrade(root,'antwoorden.txt',EXAMPLE_MC_DATA,output_path,workers=2,chunk_size=1,progress=io.StringIO())
+            self.assertEqual(done,3)
+            with open(output_path) as fh:
+                records = {record['path']: record for record in map(json.loads,fh)}
+            self.assertEqual(records[os.path.join('groep1','jan','antwoorden.txt')],{'path': os.path.join('groep1','jan','antwoorden.txt'),'format': True,'answers': True})
+            self.assertEqual(records[os.path.join('groep1','piet','antwoorden.txt')]['answers'],False)
+            self.assertEqual(records[os.path.join('groep1','mieke','antwoorden.txt')]['format'],False)
+            # nothing left to do when resuming
+            self.assertEqual(regrade(root,'antwoorden.txt',EXAMPLE_MC_DATA,output_path,workers=1,progress=None),0)
+
+    def test_resume_retries_errors(self):
+        with tempfile.TemporaryDirectory() as root:
+            for (student,content) in self.submissions.items():
+                os.makedirs(os.path.join(root,student))
+                with open(os.path.join(root,student,'antwoorden.txt'),'w') as fh:
+                    fh.write(content)
+            output_path = os.path.join(root,'uitkomsten.jsonl')
+            with open(output_path,'w') as fh:
+                fh.write(json.dumps({'path': os.path.join('jan','antwoorden.txt'),'error': 'PermissionError: [Errno 13] Permission denied'}) + '\n')
+                fh.write(json.dumps({'path': os.path.join('piet','antwoorden.txt'),'format': True,'answers': False}) + '\n')
+            self.assertEqual(regrade(root,'antwoorden.txt',EXAMPLE_MC_DATA,output_path,workers=1,progress=None),2)
+            with open(output_path) as fh:
+                records = list(map(json.loads,fh))
+            self.assertIn({'path': os.path.join('jan','antwoorden.txt'),'format': True,'answers': True},records)
+
+    def test_item_analysis_from_workers(self):
+        with tempfile.TemporaryDirectory() as root:
+            for (student,content) in self.submissions.items():
+                os.makedirs(os.path.join(root,student))
+                with open(os.path.join(root,student,'antwoorden.txt'),'w') as fh:
+                    fh.write(content)
+            item_analysis = ItemAnalysis()
+            regrade(root,'antwoorden.txt',EXAMPLE_MC_DATA,os.path.join(root,'uitkomsten.jsonl'),workers=2,chunk_size=1,progress=None,item_analysis=item_analysis)
+            (exercise,) = item_analysis.as_dict()['exercises']
+            self.assertEqual((exercise['submissions'],exercise['passed']),(2,1))
+            self.assertEqual(exercise['questions'][0]['chosen'],{'a': 2,'b': 1,'c': 1,'d': 1})
+
+class AnswerKeyRegistryTest(TestCase):
+
+    other_mc_data = [("Is 9 een priemgetal?",("Ja",False,"Deel eens door 3."),("Nee",True,None))]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name,'answerkeys.bin')
+        build_registry(self.path,{'vlag': EXAMPLE_MC_DATA,'priem': self.other_mc_data})
+        self.registry = AnswerKeyRegistry(self.path)
+
+    def tearDown(self):
+        set_registry(None)
+        self.registry.close()
+        self.tmp.cleanup()
+
+    def test_lookup(self):
+        self.assertEqual(len(self.registry),2)
+        self.assertIs(self.registry.get('vlag'),question_bank(EXAMPLE_MC_DATA))
+        self.assertEqual(self.registry.get('priem').answer_key().fingerprint,AnswerKey(self.other_mc_data).fingerprint)
+        self.assertNotIn('onbekend',self.registry)
+        with self.assertRaises(KeyError):
+            self.registry.get('onbekend')
+
+    def test_replaced_file_is_remapped(self):
+        self.assertEqual(len(self.registry.get('priem')),1)
+        build_registry(self.path,{'priem': EXAMPLE_MC_DATA})
+        self.assertEqual(len(self.registry.get('priem')),2)
+        self.assertNotIn('vlag',self.registry)
+
+    def test_check_by_exercise_id(self):
+        set_registry(self.registry)
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',exercise_id='vlag')
+        self.assertIs(chk.answer_key,question_bank(EXAMPLE_MC_DATA).answer_key())
+        self.assertTrue(_check(chk,b'1 ACD 2 A').outcome)
+
+    def test_key_looked_up_once_per_check(self):
+        set_registry(self.registry)
+        get_result_cache().clear()
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',exercise_id='vlag')
+        # maps the file before _check patches open
+        self.registry.get('vlag')
+        with patch.object(self.registry,'get',wraps=self.registry.get) as mock_get:
+            self.assertIsNotNone(_check(chk,b'1 B 2 A').outcomes_components[0].rendered_data)
+            self.assertEqual(mock_get.call_count,1)
+
+    def test_mc_data_or_exercise_id(self):
+        with self.assertRaises(ValueError):
+            MultipleChoiceAnswerCheck(filename='myfile.txt')
+        with self.assertRaises(ValueError):
+            MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA,exercise_id='vlag')
+
+class ImportTimeTest(TestCase):
+
+    lazy_modules = ['antlr4','xchk_multiple_choice_strategies.MultipleChoiceLexer','xchk_multiple_choice_strategies.MultipleChoiceParser']
+
+    def _imported_modules(self,module):
+        env = dict(os.environ,PYTHONPATH=os.pathsep.join(sys.path))
+        # xchk_core's models need the apps of this test run
+        code = f'import django; from django.conf import settings; settings.configure(INSTALLED_APPS={list(settings.INSTALLED_APPS)!r}); django.setup(); import {module}'
+        completed = subprocess.run([sys.executable,'-X','importtime','-c',code],env=env,capture_output=True,text=True,check=True)
+        # lines look like "import time:  self [us] | cumulative | imported package"
+        return {line.split('|')[-1].strip() for line in completed.stderr.splitlines() if line.startswith('import time:')}
+
+    def test_grammar_is_not_loaded_on_import(self):
+        for module in ['xchk_multiple_choice_strategies.apps','xchk_multiple_choice_strategies.parsing','xchk_multiple_choice_strategies.answerkey','xchk_multiple_choice_strategies.strats']:
+            imported = self._imported_modules(module)
+            self.assertIn(module,imported)
+            for lazy_module in self.lazy_modules:
+                self.assertNotIn(lazy_module,imported,module)
+
+class AntlrFallbackTest(TestCase):
+
+    def _parse_ll_only(self,text):
+        from antlr4 import CommonTokenStream, InputStream
+        from xchk_multiple_choice_strategies.MultipleChoiceLexer import MultipleChoiceLexer
+        from xchk_multiple_choice_strategies.MultipleChoiceParser import MultipleChoiceParser
+        lexer = MultipleChoiceLexer(InputStream(text))
+        lexer.removeErrorListeners()
+        parser = MultipleChoiceParser(CommonTokenStream(lexer))
+        parser.removeErrorListeners()
+        tree = parser.multiplechoice()
+        qas = []
+        for ctx in tree.qa():
+            # as extracted from the tree before answers were collected while parsing
+            number = ctx.INT()
+            if number is not None and number.getText().isdigit():
+                qas.append((int(number.getText()),''.join(l.getText() for l in ctx.LETTER() if l.symbol.tokenIndex != -1)))
+        return (parser.getNumberOfSyntaxErrors(),qas)
+
+    def test_two_stage_matches_ll(self):
+        for text in ['','A 1 B','1 A 2','1 A 2 3 B','1 A ! 2 B','1 2 A 3 B','1 a // zonder einde']:
+            (syntax_errors,qas) = self._parse_ll_only(text)
+            for try_sll in [False,True]:
+                result = parse_with_antlr(text.encode('ascii'),try_sll=try_sll)
+                self.assertEqual(result.syntax_errors,syntax_errors,repr(text))
+                self.assertEqual(result.qas,qas,repr(text))
+
+    def test_matches_tree_on_random_input(self):
+        rng = random.Random(6)
+        for _ in range(500):
+            text = ''.join(rng.choice('0123456789aBcZ \n/!') for _ in range(rng.randint(0,20)))
+            for try_sll in [False,True]:
+                result = parse_with_antlr(text.encode('ascii'),try_sll=try_sll)
+                self.assertEqual((result.syntax_errors,result.qas),self._parse_ll_only(text),repr(text))
+
+    def test_sll_only_for_lexical_errors(self):
+        cases = [(b'1 A ! 2 B',True),(b'1 a // zonder einde',True),(b'1 2 A 3 B',False),(b'A 1 B ! 2 C',False)]
+        for (data,try_sll) in cases:
+            with patch('xchk_multiple_choice_strategies.parsing.parse_with_antlr') as mock_antlr:
+                parsing.parse(data)
+            mock_antlr.assert_called_once_with(data,NULL_TIMER,try_sll=try_sll)
+
+    def test_warm_up_from_app_config(self):
+        import xchk_multiple_choice_strategies
+        from xchk_multiple_choice_strategies.apps import MultipleChoiceStrategiesConfig
+        config = MultipleChoiceStrategiesConfig('xchk_multiple_choice_strategies',xchk_multiple_choice_strategies)
+        with patch('xchk_multiple_choice_strategies.parsing.warm_up') as mock_warm_up:
+            config.ready()
+            mock_warm_up.assert_not_called()
+            with override_settings(XCHK_MC_WARM_UP_PARSER=True):
+                config.ready()
+            mock_warm_up.assert_called_once_with()
+
+    def test_warm_up_fills_lexer_dfa(self):
+        from xchk_multiple_choice_strategies.MultipleChoiceLexer import MultipleChoiceLexer
+        parsing.warm_up()
+        self.assertTrue(any(dfa.states for dfa in MultipleChoiceLexer.decisionsToDFA))
+
+class ScannerConformanceTest(TestCase):
+
+    # every string built from these is a sequence of valid tokens
+    token_pool = ['1','2','3','17','007','a','B','c','Z',' ','\t','\r\n','\n','// commentaar\n','//\r\n']
+    # these also produce lexer errors and unfinished comments
+    char_pool = '0123456789aBcZ \t\r\n/!?.-'
+
+    def _random_submission(self,rng):
+        parts = [rng.choice(['',' ','// hoofding\n'])]
+        for q_number in range(1,rng.randint(2,12)):
+            parts.append(str(q_number))
+            parts.append(rng.choice(['',' ','\n']))
+            for letter in rng.sample('abcdEFGH',rng.randint(1,4)):
+                parts.append(letter)
+                parts.append(rng.choice(['',' ','  ','\r\n','// ok\n']))
+        return ''.join(parts)
+
+    def _assert_agreement(self,text):
+        fast = scan(text.encode('ascii'))
+        slow = parse_with_antlr(text.encode('ascii'))
+        if fast is not None:
+            self.assertEqual(slow.syntax_errors,0,repr(text))
+            self.assertEqual(slow.qas,fast,repr(text))
+        yielded = []
+        try:
+            for qa in iter_scan(text.encode('ascii')):
+                yielded.append(qa)
+        except ScanRejected:
+            # what was yielded before giving up is what ANTLR finds as well
+            self.assertIsNone(fast,repr(text))
+            self.assertEqual(slow.qas[:len(yielded)],yielded,repr(text))
+        else:
+            self.assertEqual(yielded,fast,repr(text))
+        if fast is not None:
+            self.assertEqual(qa_positions(text.encode('ascii')),slow.positions,repr(text))
+        return (fast,slow)
+
+    def test_generated_submissions_are_accepted_by_both(self):
+        rng = random.Random(1)
+        for _ in range(1000):
+            text = self._random_submission(rng)
+            (fast,slow) = self._assert_agreement(text)
+            self.assertIsNotNone(fast,repr(text))
+
+    def test_token_sequences(self):
+        rng = random.Random(2)
+        for _ in range(2000):
+            text = ''.join(rng.choice(self.token_pool) for _ in range(rng.randint(0,15)))
+            (fast,slow) = self._assert_agreement(text)
+            # without lexer errors, both decide the same way
+            self.assertEqual(fast is not None,slow.syntax_errors == 0,repr(text))
+
+    def test_huge_question_numbers(self):
+        # more digits than int() converts by default since Python 3.11
+        huge = '2' + '0' * 5000
+        for (text,expected) in [(f'1 a {huge} b',[(1,'a'),(QUESTION_OUT_OF_RANGE,'b')]),
+                                (f'1 a {"0" * 5000}2 b',[(1,'a'),(2,'b')]),
+                                (f'{"0" * 5000} a',[(0,'a')])]:
+            (fast,slow) = self._assert_agreement(text)
+            self.assertEqual(fast,expected)
+            # stray characters make the scanner hand the input to ANTLR
+            (fast,slow) = self._assert_agreement(text + ' !')
+            self.assertEqual(slow.qas,expected)
+        self.assertEqual(AnswerKey(EXAMPLE_MC_DATA).grade([(1,'ACD'),(QUESTION_OUT_OF_RANGE,'A')])[-1],
+                         f'Vraag {QUESTION_OUT_OF_RANGE} is geen geldige index. Er zijn 2 vragen en deze worden geteld vanaf 1.')
+
+    def test_long_question_numbers_keep_their_value(self):
+        self.assertEqual(scan(b'1 a 9999999999 b 10000000000 c'),[(1,'a'),(9999999999,'b'),(10000000000,'c')])
+        self.assertEqual(AnswerKey(EXAMPLE_MC_DATA).grade([(1,'ACD'),(9999999999,'A'),(10000000000,'A')])[1:],
+                         ['Vraag 9999999999 is geen geldige index. Er zijn 2 vragen en deze worden geteld vanaf 1.',
+                          'Vraag 10000000000 is geen geldige index. Er zijn 2 vragen en deze worden geteld vanaf 1.'])
+
+    def test_mutated_submissions(self):
+        rng = random.Random(3)
+        for _ in range(2000):
+            text = list(self._random_submission(rng))
+            for _ in range(rng.randint(1,3)):
+                text.insert(rng.randint(0,len(text)),rng.choice(self.char_pool))
+            self._assert_agreement(''.join(text))
+
+class ByteCharStreamTest(TestCase):
+
+    def test_stream(self):
+        from antlr4 import Token
+        from xchk_multiple_choice_strategies.ByteCharStream import ByteCharStream
+        stream = ByteCharStream(b'12 ab')
+        self.assertEqual(stream.size,5)
+        self.assertEqual(stream.LA(1),ord('1'))
+        stream.consume()
+        self.assertEqual(stream.index,1)
+        self.assertEqual(stream.getText(1,3),'2 a')
+        self.assertEqual(stream.getText(3,10),'ab')
+        stream.seek(5)
+        self.assertEqual(stream.LA(1),Token.EOF)
+        self.assertEqual(str(stream),'12 ab')
+
+class ParseCacheTest(TestCase):
+
+    def setUp(self):
+        get_result_cache().clear()
+        get_parse_cache().clear()
+        self.student_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.student_path,'myfile.txt')
+        with open(self.path,'w') as fh:
+            fh.write('1 B 2 B 3 A')
+
+    def tearDown(self):
+        os.remove(self.path)
+        os.rmdir(self.student_path)
+
+    def _run_both_checks(self):
+        mc_data = [("V1",("Ja",False,None),("Nee",True,None))] * 3
+        for chk in [MultipleChoiceFormatCheck(filename='myfile.txt'),MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=mc_data)]:
+            outcome = chk.check_submission(submission=SubmissionV2(),student_path=self.student_path,desired_outcome=True,init_check_number=1,ancestor_has_alternatives=False)
+            self.assertTrue(outcome.outcome)
+
+    def test_checks_share_parse_within_run(self):
+        with patch('xchk_multiple_choice_strategies.parsing.parse',wraps=parsing.parse) as mock_parse, \
+             patch('xchk_multiple_choice_strategies.strats.iter_scan',wraps=iter_scan) as mock_iter_scan:
+            with grading_run():
+                self._run_both_checks()
+            self.assertEqual(mock_parse.call_count,1)
+            mock_iter_scan.assert_not_called()
+
+    def test_checks_share_parse_outside_run(self):
+        with patch('xchk_multiple_choice_strategies.parsing.parse',wraps=parsing.parse) as mock_parse, \
+             patch('xchk_multiple_choice_strategies.strats.iter_scan',wraps=iter_scan) as mock_iter_scan:
+            self._run_both_checks()
+            self.assertEqual(mock_parse.call_count,1)
+            mock_iter_scan.assert_not_called()
+        self.assertEqual(len(get_parse_cache()),1)
+
+    @override_settings(XCHK_MC_PARSE_CACHE_SIZE=0)
+    def test_sharing_turned_off(self):
+        # the answer check then only scans as far as it needs to
+        set_parse_cache(None)
+        try:
+            with patch('xchk_multiple_choice_strategies.parsing.parse',wraps=parsing.parse) as mock_parse, \
+                 patch('xchk_multiple_choice_strategies.strats.iter_scan',wraps=iter_scan) as mock_iter_scan:
+                self._run_both_checks()
+                self.assertEqual(mock_parse.call_count,1)
+                self.assertEqual(mock_iter_scan.call_count,1)
+        finally:
+            set_parse_cache(None)
+
+    def test_modified_file_is_parsed_again(self):
+        with grading_run() as cache:
+            first = parsing.parse_file(self.path)
+            with open(self.path,'w') as fh:
+                fh.write('1 A 2 A')
+            second = parsing.parse_file(self.path)
+            self.assertEqual(len(cache),2)
+        self.assertEqual(first.qas,[(1,'B'),(2,'B'),(3,'A')])
+        self.assertEqual(second.qas,[(1,'A'),(2,'A')])
+
+    def test_eviction(self):
+        cache = parsing.ParseCache(maxsize=2)
+        for key in 'abc':
+            cache.put(key,key)
+        self.assertEqual(len(cache),2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'),'c')
+
+class ResultCacheTest(TestCase):
+
+    def setUp(self):
+        get_result_cache().clear()
+        get_parse_cache().clear()
+
+    def test_identical_submissions_are_graded_once(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        with patch('xchk_multiple_choice_strategies.parsing.parse',wraps=parsing.parse) as mock_parse:
+            first = _check(chk,b'1 ACD 2 A')
+            second = _check(chk,b'1 ACD 2 A')
+            _check(chk,b'1 ACD 2 A',desired_outcome=False)
+            _check(MultipleChoiceFormatCheck(filename='myfile.txt'),b'1 ACD 2 A')
+        self.assertEqual(first,second)
+        self.assertEqual(mock_parse.call_count,1)
+        stats = get_result_cache().stats()
+        self.assertEqual((stats['hits'],stats['misses']),(1,3))
+
+    def test_different_answer_keys_are_kept_apart(self):
+        other_mc_data = [EXAMPLE_MC_DATA[0],("Is 9 een priemgetal?",("Ja",False,"3 x 3"),("Nee",True,None))]
+        self.assertTrue(_check(MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA),b'1 ACD 2 A').outcome)
+        self.assertFalse(_check(MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=other_mc_data),b'1 ACD 2 A').outcome)
+
+    def test_cached_value_is_not_shared(self):
+        cache = ResultCache(maxsize=2)
+        value = {'outcome': True}
+        cache.put('k',value)
+        value['outcome'] = False
+        cache.get('k')['outcome'] = False
+        self.assertEqual(cache.get('k'),{'outcome': True})
+
+    def test_eviction(self):
+        cache = ResultCache(maxsize=2)
+        for key in 'abc':
+            cache.put(key,key)
+        self.assertEqual(len(cache),2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(),{'hits': 0,'misses': 1,'size': 2,'maxsize': 2})
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_backend(self):
+        ResultCache(backend=DjangoCacheBackend('shared')).put('k',{'outcome': True})
+        other_process = ResultCache(backend=DjangoCacheBackend('shared'))
+        self.assertEqual(other_process.get('k'),{'outcome': True})
+        self.assertEqual(other_process.hits,1)
+
+class InstrumentationTest(TestCase):
+
+    def setUp(self):
+        get_result_cache().clear()
+        get_parse_cache().clear()
+        self.recorded = []
+        set_metrics_sink(self.recorded.append)
+
+    def tearDown(self):
+        set_metrics_sink(None)
+
+    def test_phases_and_counts(self):
+        chk = MultipleChoiceAnswerCheck(filename='myfile.txt',mc_data=EXAMPLE_MC_DATA)
+        with grading_run():
+            _check(MultipleChoiceFormatCheck(filename='myfile.txt'),b'1 ACD 2 A')
+            _check(chk,b'1 ACD 2 A')
+        _check(MultipleChoiceFormatCheck(filename='myfile.txt'),b'1 A ! 2 B')
+        _check(chk,b'1 ACD 2 A')
+        _check(chk,b'1 ACD 2 B')
+        (scanned,answers,fmt,cached,streamed) = self.recorded
+        self.assertEqual((scanned.check,list(scanned.phases)),('format',['read','lookup','scan','outcome']))
+        # graded from the parse of the format check
+        self.assertEqual((answers.check,list(answers.phases)),('answers',['read','lookup','grade','outcome']))
+        self.assertEqual((answers.file_size,answers.token_count,answers.question_count),(9,6,2))
+        # the stray character sends this one through ANTLR
+        self.assertEqual((fmt.check,list(fmt.phases)),('format',['read','lookup','scan','lex','parse','outcome']))
+        self.assertEqual((fmt.file_size,fmt.token_count,fmt.question_count),(9,4,2))
+        self.assertEqual(list(cached.phases),['read','lookup'])
+        self.assertIsNone(cached.token_count)
+        # graded while scanning, as no other check parsed it
+        self.assertEqual(list(streamed.phases),['read','lookup','grade','outcome'])
+        self.assertIsNone(streamed.question_count)
+
+    def test_histogram_sink(self):
+        sink = HistogramSink()
+        set_metrics_sink(sink)
+        for content in [b'1 A',b'1 A 2 B',b'1 A 2 B 3 C']:
+            _check(MultipleChoiceFormatCheck(filename='myfile.txt'),content)
+        snapshot = sink.snapshot()
+        self.assertEqual(snapshot['format.scan_us']['count'],3)
+        self.assertEqual(snapshot['format.question_count']['max'],3)
+        self.assertEqual(snapshot['format.question_count']['buckets'],{'<2': 1,'<4': 2})
+        out = io.StringIO()
+        sink.dump(out)
+        self.assertEqual(json.loads(out.getvalue()),snapshot)
+
 if __name__ == '__main__':
     unittest.main()